@@ -1,12 +1,23 @@
 #run app with ./run.sh from project root directory
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from database import get_db, init_db
+from database import get_db, init_db, parse_date, to_day, DEFAULT_SETTINGS, encode_setting
+import database
+from csv_import import parse_csv, CSVFormatError
+import instrumentation
+import tenancy
+import http_cache
+from http_cache import conditional
+import change_feed
+import export
+import archive
+import scenarios
+import backup
 import os
+import hmac
+from functools import wraps
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-import csv
-import io
 from collections import defaultdict
 import difflib
 import re
@@ -15,55 +26,103 @@ import json
 
 app = Flask(__name__)
 CORS(app)
-
-def init_settings():
-    """Initialize default settings if they don't exist"""
-    defaults = {
-        'recurring_sensitivity': 0.8,
-        'auto_confirm_sensitivity': 0.7,
-        'custom_recurring_algorithm': {
-            "min_occurrences": 2,
-            "interval_tolerance": 0.3,
-            "amount_tolerance": 0.1,
-            "frequency_detection": {
-                "daily": 1,
-                "weekly": 7,
-                "monthly": 30
-            }
-        },
-        'custom_auto_confirm_algorithm': {
-            "similarity_threshold": 0.7,
-            "amount_tolerance": 0.05,
-            "date_diff_max": 3,
-            "high_confidence": {
-                "similarity": 0.9,
-                "amount": 0.01
-            }
-        },
-        'date_format': 'DD-MMMM-YYYY',
-        'forecast_period': 12
-    }
-    
-    with get_db() as conn:
-        for key, value in defaults.items():
-            # Check if key exists
-            existing = conn.execute('SELECT id FROM settings WHERE key = ?', (key,)).fetchone()
-            if not existing:
-                conn.execute(
-                    'INSERT INTO settings (key, value) VALUES (?, ?)',
-                    (key, json.dumps(value) if isinstance(value, (dict, list)) else str(value))
-                )
-        conn.commit()
-
-# Initialize database and settings on startup
+instrumentation.init_app(app)
+tenancy.init_app(app)
+http_cache.init_app(app)
+change_feed.init_app(app)
+backup.init_app(app)
+
+# Bring the default database up to date on startup (a single PRAGMA read when
+# current) and provision configured tenants; other shards are migrated on first use
 init_db()
-init_settings()
+for tenant in database.CONFIGURED_TENANTS:
+    database.create_tenant(tenant)
 
 @app.route('/')
 def hello():
     return jsonify({'message': 'BillPrepared API'})
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Per-endpoint latency and SQL metrics in Prometheus text format"""
+    if not instrumentation.ENABLED:
+        return jsonify({'error': 'Metrics are disabled (set BILLPREPARED_METRICS=1)'}), 404
+    return Response(instrumentation.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+# Admin routes (backup, restore) are off unless BILLPREPARED_ADMIN_TOKEN is
+# set, and then need an "Authorization: Bearer <token>" header
+ADMIN_TOKEN = os.environ.get('BILLPREPARED_ADMIN_TOKEN')
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Admin endpoints are disabled (set BILLPREPARED_ADMIN_TOKEN)'}), 404
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {ADMIN_TOKEN}'.encode()):
+            return jsonify({'error': 'Admin token required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/admin/backup', methods=['POST'])
+@admin_required
+def create_backup():
+    """Take a snapshot of the tenant's database now (see backup.py)"""
+    return jsonify(backup.backup()), 201
+
+@app.route('/api/admin/backups', methods=['GET'])
+@admin_required
+def list_backups():
+    """The tenant's snapshots, oldest first"""
+    return jsonify([backup.describe(snapshot) for snapshot in backup.snapshots()])
+
+@app.route('/api/admin/restore', methods=['POST'])
+@admin_required
+def restore_backup():
+    """Restore the newest snapshot at or before `at`, or the one named `snapshot`"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(backup.restore(at=data.get('at'), name=data.get('snapshot')))
+    except backup.SnapshotNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except backup.BackupError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Coalesced inserted/updated/deleted rows since a change sequence number"""
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', change_feed.DEFAULT_LIMIT, type=int)
+    # limit=0 would report the latest seq with no changes, so a client
+    # advancing its cursor to it would skip everything pending
+    limit = max(1, min(limit, change_feed.DEFAULT_LIMIT))
+    with get_db() as conn:
+        change_feed.maybe_compact(conn)
+        if since is None:
+            # No cursor yet: just report where the feed currently is
+            return jsonify({'seq': change_feed.latest_seq(conn), 'reset': False, 'more': False, 'changes': []})
+        return jsonify(change_feed.changes_since(conn, since, limit))
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """Server-Sent Events stream of the change feed"""
+    since = request.args.get('since', type=int)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+    if not change_feed.acquire_stream():
+        return jsonify({'error': 'Too many open change streams, poll /api/changes instead'}), 503
+    response = Response(
+        stream_with_context(change_feed.stream_changes(since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the stream ends or the client goes away, even if it never started
+    response.call_on_close(change_feed.release_stream)
+    return response
+
 @app.route('/api/transactions', methods=['GET'])
+@conditional
 def get_transactions():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
@@ -88,19 +147,24 @@ def get_transactions():
             end = datetime.now() + relativedelta(months=forecast_months)
             end_date = end.strftime('%Y-%m-%d')
 
-    query = 'SELECT * FROM transactions WHERE 1=1'
-    params = []
+    try:
+        start_day = to_day(start_date)
+        end_day = to_day(end_date)
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    # Only windows reaching back into archived days read through the UNION view
+    with get_db() as conn:
+        source = archive.transactions_source(conn, start_day)
 
-    query += ' AND date >= ?'
-    params.append(start_date)
-    query += ' AND date <= ?'
-    params.append(end_date)
+    query = f'SELECT * FROM {source} WHERE day BETWEEN ? AND ?'
+    params = [start_day, end_day]
     
     if confirmed is not None:
         query += ' AND is_confirmed = ?'
         params.append(confirmed == 'true')
 
-    query += ' ORDER BY date ASC'  # Oldest first, future dates at bottom
+    query += ' ORDER BY day ASC'  # Oldest first, future dates at bottom
 
     if limit:
         query += ' LIMIT ? OFFSET ?'
@@ -121,16 +185,28 @@ def add_transaction():
     is_confirmed = data.get('is_confirmed', False)
     is_recurring = data.get('is_recurring', False)
     recurring_id = data.get('recurring_id')
+    try:
+        date = parse_date(date).isoformat()
+        day = to_day(date)
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
 
     with get_db() as conn:
         cursor = conn.execute('''
-            INSERT INTO transactions (description, amount, date, label, is_confirmed, is_recurring, recurring_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (description, amount, date, label, is_confirmed, is_recurring, recurring_id))
+            INSERT INTO transactions (description, amount, date, day, label, is_confirmed, is_recurring, recurring_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (description, amount, date, day, label, is_confirmed, is_recurring, recurring_id))
         transaction_id = cursor.lastrowid
 
     return jsonify({'id': transaction_id}), 201
 
+def transaction_not_found(conn, id):
+    """Error response for an id missing from the hot table: archived rows are
+    listed (see archive.py) but read-only"""
+    if conn.execute('SELECT 1 FROM transactions_archive WHERE id = ?', (id,)).fetchone():
+        return jsonify({'error': 'Archived transactions are read-only'}), 409
+    return jsonify({'error': 'Transaction not found'}), 404
+
 @app.route('/api/transactions/<int:id>', methods=['PUT'])
 def update_transaction(id):
     data = request.get_json()
@@ -140,18 +216,24 @@ def update_transaction(id):
     label = data.get('label')
     is_confirmed = data.get('is_confirmed')
     edit_type = data.get('edit_type')  # 'single' or 'future'
+    if date:
+        try:
+            date = parse_date(date).isoformat()
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
 
     with get_db() as conn:
         tx = conn.execute('SELECT * FROM transactions WHERE id = ?', (id,)).fetchone()
         if not tx:
-            return jsonify({'error': 'Transaction not found'}), 404
+            return transaction_not_found(conn, id)
 
         if tx['is_recurring'] and edit_type == 'single':
             # Create new non-recurring transaction
+            new_date = date or tx['date']
             conn.execute('''
-                INSERT INTO transactions (description, amount, date, label, is_confirmed, is_recurring, recurring_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (description or tx['description'], amount or tx['amount'], date or tx['date'], label or tx['label'], is_confirmed if is_confirmed is not None else tx['is_confirmed'], False, None))
+                INSERT INTO transactions (description, amount, date, day, label, is_confirmed, is_recurring, recurring_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (description or tx['description'], amount or tx['amount'], new_date, to_day(new_date), label or tx['label'], is_confirmed if is_confirmed is not None else tx['is_confirmed'], False, None))
             # Delete the old recurring instance
             conn.execute('DELETE FROM transactions WHERE id = ?', (id,))
         elif tx['is_recurring'] and edit_type == 'future':
@@ -165,15 +247,14 @@ def update_transaction(id):
                     start_date = COALESCE(?, start_date)
                 WHERE id = ?
             ''', (description, amount, label, date, recurring_id))
-            conn.commit()  # Commit to make changes visible to generate function
             # Regenerate future transactions
-            conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND date >= ?', (recurring_id, date or tx['date']))
+            conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND day >= ?', (recurring_id, to_day(date or tx['date'])))
             transactions = generate_recurring_transactions(recurring_id, date or tx['date'])
             for t in transactions:
                 conn.execute('''
-                    INSERT INTO transactions (description, amount, date, label, is_recurring, recurring_id)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (t['description'], t['amount'], t['date'], t['label'], t['is_recurring'], t['recurring_id']))
+                    INSERT INTO transactions (description, amount, date, day, label, is_recurring, recurring_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (t['description'], t['amount'], t['date'], t['day'], t['label'], t['is_recurring'], t['recurring_id']))
         else:
             # Regular update
             conn.execute('''
@@ -181,10 +262,11 @@ def update_transaction(id):
                 SET description = COALESCE(?, description),
                     amount = COALESCE(?, amount),
                     date = COALESCE(?, date),
+                    day = COALESCE(?, day),
                     label = COALESCE(?, label),
                     is_confirmed = COALESCE(?, is_confirmed)
                 WHERE id = ?
-            ''', (description, amount, date, label, is_confirmed, id))
+            ''', (description, amount, date, to_day(date) if date else None, label, is_confirmed, id))
 
     return jsonify({'message': 'Transaction updated'})
 
@@ -195,18 +277,50 @@ def delete_transaction(id):
     with get_db() as conn:
         tx = conn.execute('SELECT * FROM transactions WHERE id = ?', (id,)).fetchone()
         if not tx:
-            return jsonify({'error': 'Transaction not found'}), 404
+            return transaction_not_found(conn, id)
 
         if delete_type == 'future' and tx['is_recurring']:
             # Delete all future transactions for this recurring series
-            conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND date >= ?', (tx['recurring_id'], tx['date']))
+            conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND day >= ?', (tx['recurring_id'], tx['day']))
         else:
             # Delete single transaction
             conn.execute('DELETE FROM transactions WHERE id = ?', (id,))
 
     return jsonify({'message': 'Transaction deleted'})
 
+@app.route('/api/export', methods=['GET'])
+def export_transactions():
+    """Stream transactions as CSV or NDJSON without loading them into memory"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f'format must be one of: {sorted(export.FORMATS)}'}), 400
+    confirmed = request.args.get('confirmed')
+    # A mistyped filter must not silently export the wrong rows
+    if confirmed not in (None, 'true', 'false'):
+        return jsonify({'error': "confirmed must be 'true' or 'false'"}), 400
+    recurring_id = request.args.get('recurring_id')
+    if recurring_id is not None:
+        if not recurring_id.isdigit():
+            return jsonify({'error': 'recurring_id must be an integer'}), 400
+        recurring_id = int(recurring_id)
+    try:
+        query, params = export.build_query(
+            request.args.get('start_date'),
+            request.args.get('end_date'),
+            None if confirmed is None else confirmed == 'true',
+            recurring_id
+        )
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+
+    return Response(
+        stream_with_context(export.STREAMERS[fmt](query, params)),
+        mimetype=export.FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=transactions.{fmt}'}
+    )
+
 @app.route('/api/balance', methods=['GET'])
+@conditional
 def get_balance():
     with get_db() as conn:
         settings = conn.execute('SELECT * FROM user_settings WHERE id = 1').fetchone()
@@ -226,14 +340,16 @@ def update_balance():
 
 def generate_recurring_transactions(recurring_id, start_date=None, end_date=None):
     """Generate future transactions for a recurring rule"""
-    with get_db() as conn:
-        recurring = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
-        if not recurring:
-            return []
-        
-        # Fetch forecast_period from settings
-        settings_row = conn.execute('SELECT value FROM settings WHERE key = ?', ('forecast_period',)).fetchone()
-        forecast_months = int(settings_row['value']) if settings_row else 12
+    # Read on the caller's connection without committing, so an update in
+    # progress stays atomic and its new values are seen here
+    conn = get_db()
+    recurring = conn.execute('SELECT * FROM recurring_transactions WHERE id = ?', (recurring_id,)).fetchone()
+    if not recurring:
+        return []
+
+    # Fetch forecast_period from settings
+    settings_row = conn.execute('SELECT value FROM settings WHERE key = ?', ('forecast_period',)).fetchone()
+    forecast_months = int(settings_row['value']) if settings_row else 12
 
     description = recurring['description']
     amount = recurring['amount']
@@ -245,6 +361,7 @@ def generate_recurring_transactions(recurring_id, start_date=None, end_date=None
 
     transactions = []
     current = start
+    window_start = to_day(datetime.now() - timedelta(days=30))
 
     # Skip the first occurrence (start_date) to avoid duplicates
     if frequency == 'daily':
@@ -255,11 +372,13 @@ def generate_recurring_transactions(recurring_id, start_date=None, end_date=None
         current += relativedelta(months=interval)
 
     while current <= end:
-        if current.date() >= (datetime.now() - timedelta(days=30)).date():  # Include past month
+        day = to_day(current)
+        if day >= window_start:  # Include past month
             transactions.append({
                 'description': description,
                 'amount': amount,
                 'date': current.strftime('%Y-%m-%d'),
+                'day': day,
                 'label': label,
                 'is_recurring': True,
                 'recurring_id': recurring_id
@@ -272,6 +391,23 @@ def generate_recurring_transactions(recurring_id, start_date=None, end_date=None
             current += relativedelta(months=interval)
     return transactions
 
+@app.route('/api/scenarios', methods=['POST'])
+def project_scenarios():
+    """Project monthly balances for a batch of what-if scenarios; nothing is saved"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    horizon = data.get('horizon_months', scenarios.HORIZON_MONTHS)
+    if isinstance(horizon, bool) or not isinstance(horizon, int) or not 1 <= horizon <= scenarios.MAX_HORIZON_MONTHS:
+        return jsonify({'error': f'horizon_months must be between 1 and {scenarios.MAX_HORIZON_MONTHS}'}), 400
+
+    with get_db() as conn:
+        baseline = scenarios.Baseline.load(conn, horizon=horizon)
+    try:
+        return jsonify(scenarios.run_scenarios(baseline, data.get('scenarios', [])))
+    except scenarios.ScenarioError as e:
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/recurring', methods=['POST'])
 def add_recurring_transaction():
     data = request.get_json()
@@ -295,9 +431,9 @@ def add_recurring_transaction():
         transactions = generate_recurring_transactions(recurring_id, start_date, end_date)
         for tx in transactions:
             conn.execute('''
-                INSERT INTO transactions (description, amount, date, label, is_confirmed, is_recurring, recurring_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (tx['description'], tx['amount'], tx['date'], tx['label'], False, tx['is_recurring'], tx['recurring_id']))
+                INSERT INTO transactions (description, amount, date, day, label, is_confirmed, is_recurring, recurring_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (tx['description'], tx['amount'], tx['date'], tx['day'], tx['label'], False, tx['is_recurring'], tx['recurring_id']))
 
     return jsonify({'id': recurring_id}), 201
 
@@ -326,21 +462,22 @@ def update_recurring_transaction(id):
         ''', (description, amount, start_date, label, frequency, interval, end_date, id))
 
         # Regenerate future transactions
-        conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND date >= ?', (id, datetime.now().strftime('%Y-%m-%d')))
+        conn.execute('DELETE FROM transactions WHERE recurring_id = ? AND day >= ?', (id, to_day(datetime.now())))
         transactions = generate_recurring_transactions(id, start_date or datetime.now().strftime('%Y-%m-%d'), end_date)
         for tx in transactions:
             conn.execute('''
-                INSERT INTO transactions (description, amount, date, label, is_confirmed, is_recurring, recurring_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (tx['description'], tx['amount'], tx['date'], tx['label'], False, tx['is_recurring'], tx['recurring_id']))
+                INSERT INTO transactions (description, amount, date, day, label, is_confirmed, is_recurring, recurring_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (tx['description'], tx['amount'], tx['date'], tx['day'], tx['label'], False, tx['is_recurring'], tx['recurring_id']))
 
     return jsonify({'message': 'Recurring transaction updated'})
 
 @app.route('/api/recurring/<int:id>', methods=['DELETE'])
 def delete_recurring_transaction(id):
     with get_db() as conn:
-        # Delete all associated transactions
+        # Delete all associated transactions, archived history included
         conn.execute('DELETE FROM transactions WHERE recurring_id = ?', (id,))
+        conn.execute('DELETE FROM transactions_archive WHERE recurring_id = ?', (id,))
         conn.execute('DELETE FROM recurring_transactions WHERE id = ?', (id,))
 
     return jsonify({'message': 'Recurring transaction deleted'})
@@ -357,28 +494,11 @@ def import_csv_recurring():
     if not file.filename.endswith('.csv'):
         return jsonify({'error': 'File must be CSV'}), 400
 
-    # Parse CSV
-    csv_data = []
-    stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-    reader = csv.reader(stream)
-    for row in reader:
-        if len(row) >= 3:
-            date_str, amount_str, description = row[0], row[1], row[2]
-            try:
-                # Parse date DD/MM/YYYY to YYYY-MM-DD
-                date_parts = date_str.split('/')
-                if len(date_parts) == 3:
-                    date = f"{date_parts[2]}-{date_parts[1].zfill(2)}-{date_parts[0].zfill(2)}"
-                else:
-                    continue
-                amount = float(amount_str.strip('"'))
-                csv_data.append({
-                    'date': date,
-                    'amount': amount,
-                    'description': description.strip()
-                })
-            except ValueError:
-                continue
+    # Parse CSV (date format, amount style and column order are detected per file)
+    try:
+        csv_data = parse_csv(file.stream.read().decode("utf-8-sig"))
+    except CSVFormatError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Detect recurring transactions
     recurring_candidates = detect_recurring(csv_data)
@@ -407,22 +527,20 @@ def detect_recurring(csv_data):
     candidates = []
     for amt_key, tx_list in groups.items():
         dates = [tx['date'] for tx in tx_list]
+        days = [tx['day'] for tx in tx_list]
         amounts = [tx['amount'] for tx in tx_list]
         descriptions = [tx['description'] for tx in tx_list]
 
         if len(dates) >= 2:  # At least 2 occurrences
             # Sort dates
-            sorted_indices = sorted(range(len(dates)), key=lambda i: dates[i])
+            sorted_indices = sorted(range(len(dates)), key=lambda i: days[i])
             sorted_dates = [dates[i] for i in sorted_indices]
+            sorted_days = [days[i] for i in sorted_indices]
             sorted_amounts = [amounts[i] for i in sorted_indices]
             sorted_descriptions = [descriptions[i] for i in sorted_indices]
 
             # Check for regular intervals - be more lenient to avoid missing recurring transactions
-            intervals = []
-            for i in range(1, len(sorted_dates)):
-                d1 = datetime.fromisoformat(sorted_dates[i-1])
-                d2 = datetime.fromisoformat(sorted_dates[i])
-                intervals.append((d2 - d1).days)
+            intervals = [sorted_days[i] - sorted_days[i-1] for i in range(1, len(sorted_days))]
 
             if intervals:
                 avg_interval = sum(intervals) / len(intervals)
@@ -475,28 +593,11 @@ def import_csv_confirm():
     if not file.filename.endswith('.csv'):
         return jsonify({'error': 'File must be CSV'}), 400
 
-    # Parse CSV
-    csv_data = []
-    stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-    reader = csv.reader(stream)
-    for row in reader:
-        if len(row) >= 3:
-            date_str, amount_str, description = row[0], row[1], row[2]
-            try:
-                # Parse date DD/MM/YYYY to YYYY-MM-DD
-                date_parts = date_str.split('/')
-                if len(date_parts) == 3:
-                    date = f"{date_parts[2]}-{date_parts[1].zfill(2)}-{date_parts[0].zfill(2)}"
-                else:
-                    continue
-                amount = float(amount_str.strip('"'))
-                csv_data.append({
-                    'date': date,
-                    'amount': amount,
-                    'description': description.strip()
-                })
-            except ValueError:
-                continue
+    # Parse CSV (date format, amount style and column order are detected per file)
+    try:
+        csv_data = parse_csv(file.stream.read().decode("utf-8-sig"))
+    except CSVFormatError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Auto-confirm matching transactions
     result = auto_confirm_transactions(csv_data)
@@ -508,11 +609,13 @@ def auto_confirm_transactions(csv_data):
     potential_updates = []
     with get_db() as conn:
         for csv_tx in csv_data:
+            csv_day = csv_tx['day']
+
             # Find exact match
             exact_matches = conn.execute('''
                 SELECT id, recurring_id FROM transactions
-                WHERE date = ? AND amount = ? AND description = ? AND is_confirmed = FALSE
-            ''', (csv_tx['date'], csv_tx['amount'], csv_tx['description'])).fetchall()
+                WHERE is_confirmed = FALSE AND day = ? AND amount = ? AND description = ?
+            ''', (csv_day, csv_tx['amount'], csv_tx['description'])).fetchall()
 
             if exact_matches:
                 # Confirm the first match
@@ -525,26 +628,20 @@ def auto_confirm_transactions(csv_data):
                 continue
 
             # Fuzzy matching with enhanced logic
-            # Get all unconfirmed transactions for fuzzy comparison
-            all_unconfirmed = conn.execute('''
-                SELECT id, description, amount, date, recurring_id FROM transactions
-                WHERE is_confirmed = FALSE
-            ''').fetchall()
+            # Get unconfirmed transactions within 3 days of the CSV date for fuzzy comparison
+            nearby_unconfirmed = conn.execute('''
+                SELECT id, description, amount, date, day, recurring_id FROM transactions
+                WHERE is_confirmed = FALSE AND day BETWEEN ? AND ?
+            ''', (csv_day - 3, csv_day + 3)).fetchall()
 
             best_match = None
             best_score = 0
+            csv_norm = normalize_description(csv_tx['description'])
 
-            for db_tx in all_unconfirmed:
-                # Date check with tolerance
-                csv_date = datetime.fromisoformat(csv_tx['date'])
-                db_date = datetime.fromisoformat(db_tx['date'])
-                date_diff_days = abs((csv_date - db_date).days)
-
-                if date_diff_days > 3:  # Skip if date difference > 3 days
-                    continue
+            for db_tx in nearby_unconfirmed:
+                date_diff_days = abs(csv_day - db_tx['day'])
 
                 # Normalize descriptions
-                csv_norm = normalize_description(csv_tx['description'])
                 db_norm = normalize_description(db_tx['description'])
 
                 # Calculate similarity
@@ -562,7 +659,6 @@ def auto_confirm_transactions(csv_data):
                     best_match = db_tx
 
             if best_match and best_score > 0.7:  # Minimum threshold
-                csv_norm = normalize_description(csv_tx['description'])
                 db_norm = normalize_description(best_match['description'])
                 similarity = calculate_similarity(csv_norm, db_norm)
                 amount_diff = abs(csv_tx['amount'] - best_match['amount'])
@@ -603,7 +699,10 @@ def confirm_update():
     with get_db() as conn:
         # Use a single transaction for atomicity and better performance
         # Confirm the transaction and update its amount
-        conn.execute('UPDATE transactions SET is_confirmed = TRUE, amount = ? WHERE id = ?', (new_amount, transaction_id))
+        updated = conn.execute('UPDATE transactions SET is_confirmed = TRUE, amount = ? WHERE id = ?',
+                               (new_amount, transaction_id)).rowcount
+        if not updated:
+            return transaction_not_found(conn, transaction_id)
 
         if update_future and recurring_id:
             # Update the recurring rule
@@ -612,8 +711,8 @@ def confirm_update():
             conn.execute('''
                 UPDATE transactions
                 SET amount = ?
-                WHERE recurring_id = ? AND date > ? AND is_confirmed = FALSE
-            ''', (new_amount, recurring_id, datetime.now().strftime('%Y-%m-%d')))
+                WHERE recurring_id = ? AND day > ? AND is_confirmed = FALSE
+            ''', (new_amount, recurring_id, to_day(datetime.now())))
 
     return jsonify({'message': 'Updated successfully'})
 
@@ -624,7 +723,7 @@ def confirm_single_transaction(id):
         # Check if transaction exists and get its current state
         tx = conn.execute('SELECT is_confirmed FROM transactions WHERE id = ?', (id,)).fetchone()
         if not tx:
-            return jsonify({'error': 'Transaction not found'}), 404
+            return transaction_not_found(conn, id)
 
         if tx['is_confirmed']:
             return jsonify({'message': 'Transaction already confirmed'})
@@ -651,6 +750,7 @@ def update_user_preference(show_advanced):
         return False  # Ignore false, no change
 
 @app.route('/api/user/preferences', methods=['GET'])
+@conditional
 def get_preferences():
     """Retrieve the user's show_advanced preference"""
     try:
@@ -683,6 +783,7 @@ def update_preferences():
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/settings', methods=['GET'])
+@conditional
 def get_settings():
     """Get all settings as JSON"""
     with get_db() as conn:
@@ -729,7 +830,8 @@ def update_settings():
                         continue
                     updated_settings[key] = val
                     conn.execute(
-                        'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                        'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                        'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
                         (key, str(val))
                     )
                 except ValueError:
@@ -743,7 +845,8 @@ def update_settings():
                         continue
                     updated_settings[key] = val
                     conn.execute(
-                        'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                        'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                        'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
                         (key, str(val))
                     )
                 except ValueError:
@@ -754,7 +857,8 @@ def update_settings():
                     json_val = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
                     updated_settings[key] = value
                     conn.execute(
-                        'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                        'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                        'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
                         (key, json_val)
                     )
                 except (TypeError, ValueError):
@@ -766,7 +870,8 @@ def update_settings():
                     continue
                 updated_settings[key] = value
                 conn.execute(
-                    'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
+                    'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
                     (key, value)
                 )
             
@@ -785,48 +890,21 @@ def update_settings():
 @app.route('/api/settings/<key>/restore', methods=['POST'])
 def restore_default(key):
     """Restore default for a specific setting"""
-    defaults = {
-        'recurring_sensitivity': 0.8,
-        'auto_confirm_sensitivity': 0.7,
-        'custom_recurring_algorithm': {
-            "min_occurrences": 2,
-            "interval_tolerance": 0.3,
-            "amount_tolerance": 0.1,
-            "frequency_detection": {
-                "daily": 1,
-                "weekly": 7,
-                "monthly": 30
-            }
-        },
-        'custom_auto_confirm_algorithm': {
-            "similarity_threshold": 0.7,
-            "amount_tolerance": 0.05,
-            "date_diff_max": 3,
-            "high_confidence": {
-                "similarity": 0.9,
-                "amount": 0.01
-            }
-        },
-        'date_format': 'DD-MMMM-YYYY',
-        'forecast_period': 12
-    }
-    
-    if key not in defaults:
+    if key not in DEFAULT_SETTINGS:
         return jsonify({'error': 'Unknown setting'}), 400
     
-    default_value = defaults[key]
+    default_value = DEFAULT_SETTINGS[key]
     with get_db() as conn:
         conn.execute(
-            'INSERT OR REPLACE INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)',
-            (key, json.dumps(default_value) if isinstance(default_value, (dict, list)) else str(default_value))
+            'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at',
+            (key, encode_setting(default_value))
         )
         conn.commit()
     
     return jsonify({'message': f'{key} restored to default', 'value': default_value})
 
 if __name__ == '__main__':
-    init_db()
-    init_settings()
     try:
         app.run(host='0.0.0.0', port=5000, debug=True)
     except OSError as e:
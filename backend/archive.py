@@ -0,0 +1,123 @@
+"""Hot/cold partitioning of transactions.
+
+Confirmed transactions older than ARCHIVE_AFTER_DAYS are moved from
+transactions into transactions_archive in batches of BATCH_SIZE, each in its
+own short write transaction, so the app keeps serving requests while a large
+history is archived. Everyday queries (the default transaction window,
+auto-confirm's unconfirmed-row lookups, recurring regeneration) only touch the
+hot table, which stays the same size however much history accumulates.
+
+Reads that reach back into archived days go through the all_transactions
+view (see transactions_source). Archived rows are read-only history: the edit,
+delete and confirm endpoints only change the hot table, and answer 409 for an
+archived id.
+
+Compaction (archive, prune the change log, then checkpoint the WAL and refresh
+planner statistics) runs from the command line:
+    python archive.py --older-than-days 365
+    python archive.py --all-tenants --vacuum
+"""
+import argparse
+import os
+from datetime import date
+
+from change_feed import compact_change_log
+from database import connect, migrate, tenants, to_day, DEFAULT_TENANT, TRANSACTION_COLUMNS
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('BILLPREPARED_ARCHIVE_AFTER_DAYS', '365'))
+BATCH_SIZE = 2000
+
+ARCHIVE_COLUMNS = ', '.join(TRANSACTION_COLUMNS)
+# One batch of archivable rows, oldest first, captured once into a temp table
+# so the copy and the delete act on exactly the same ids
+_BATCH = '''
+    INSERT INTO temp.archive_batch (id)
+    SELECT id FROM transactions
+    WHERE is_confirmed = TRUE AND day < ?
+    ORDER BY day, id
+    LIMIT ?
+'''
+
+
+def archived_through(conn):
+    """Latest day held in the archive, or None if it is empty"""
+    return conn.execute('SELECT MAX(day) FROM transactions_archive').fetchone()[0]
+
+
+def transactions_source(conn, start_day):
+    """Table or view to read for a window starting at start_day"""
+    latest = archived_through(conn)
+    if latest is not None and start_day <= latest:
+        return 'all_transactions'
+    return 'transactions'
+
+
+def archive_transactions(conn, before_day, batch_size=BATCH_SIZE):
+    """Move confirmed transactions dated before before_day into the archive.
+
+    Commits after every batch; returns the number of rows moved.
+    """
+    moved = 0
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM temp.archive_batch')
+            conn.execute(_BATCH, (before_day, batch_size))
+            conn.execute(f'''
+                INSERT INTO transactions_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM transactions WHERE id IN (SELECT id FROM temp.archive_batch)
+            ''')
+            count = conn.execute('DELETE FROM transactions WHERE id IN (SELECT id FROM temp.archive_batch)').rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+def compact(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, vacuum=False):
+    """Archive old history and prune the change log, then checkpoint the WAL
+    and refresh statistics.
+
+    VACUUM returns freed pages to the filesystem but holds the write lock for
+    its whole run, so it is opt-in.
+    """
+    before_day = to_day(date.today()) - older_than_days
+    moved = archive_transactions(conn, before_day, batch_size)
+    compact_change_log(conn)
+    conn.commit()
+    conn.execute('PRAGMA optimize')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    if vacuum:
+        conn.execute('VACUUM')
+    hot = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+    archived = conn.execute('SELECT COUNT(*) FROM transactions_archive').fetchone()[0]
+    return {'moved': moved, 'hot_rows': hot, 'archived_rows': archived}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive old confirmed transactions and compact the database')
+    parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--vacuum', action='store_true', help='also VACUUM (blocks writers while it runs)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--tenant', default=DEFAULT_TENANT)
+    group.add_argument('--all-tenants', action='store_true')
+    args = parser.parse_args()
+
+    for tenant in tenants() if args.all_tenants else [args.tenant]:
+        conn = connect(tenant)
+        try:
+            migrate(conn)
+            stats = compact(conn, args.older_than_days, args.batch_size, args.vacuum)
+        finally:
+            conn.close()
+        print(f"{tenant}: archived {stats['moved']} rows "
+              f"({stats['hot_rows']} hot, {stats['archived_rows']} archived)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""Online snapshot backups of tenant databases.
+
+backup() copies a live database with the SQLite backup API, BACKUP_PAGES
+pages per step, pausing BACKUP_PAUSE_SECONDS between steps so that
+foreground queries still get the disk. The source connection holds one read
+transaction for the whole copy. Under WAL that doesn't block writers, and the
+copy stays a consistent snapshot. Without it, the backup would restart every
+time a request commits. The copy is gzipped into
+BACKUP_DIR/<tenant>/<UTC timestamp>.db.gz, and only the newest BACKUP_KEEP
+snapshots of each tenant are kept.
+
+restore() puts back the newest snapshot taken at or before a point in time
+(or a named one). It snapshots the current state first, so a restore can be
+undone. It also moves data_version and the change log sequence past their
+current values, so cached ETags and change feed cursors from before the
+restore are invalidated instead of matching restored data.
+
+Backups are taken by POST /api/admin/backup, from the command line, or every
+BACKUP_INTERVAL_HOURS by a background thread that init_app starts when that
+interval is set. Backups, restores and rotation of a tenant hold an flock on
+BACKUP_DIR/<tenant>/.lock, so they exclude each other across threads and
+across processes (gunicorn workers, cron jobs) sharing BACKUP_DIR:
+    python backup.py --all-tenants
+    python backup.py --list
+    python backup.py --restore 2026-10-01T12:00:00 --tenant default
+"""
+import argparse
+import contextlib
+import fcntl
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import DATABASE, DEFAULT_TENANT, connect, current_tenant, migrate, tenants, valid_tenant
+
+BACKUP_DIR = os.environ.get('BILLPREPARED_BACKUP_DIR', os.path.join(os.path.dirname(DATABASE), 'backups'))
+BACKUP_KEEP = int(os.environ.get('BILLPREPARED_BACKUP_KEEP', '14'))
+# 0 disables scheduled backups
+BACKUP_INTERVAL_HOURS = float(os.environ.get('BILLPREPARED_BACKUP_INTERVAL_HOURS', '0'))
+BACKUP_PAGES = 1024
+BACKUP_PAUSE_SECONDS = 0.005
+# gzip level 1: about 12% larger than level 6 but well under half the CPU,
+# which the app's requests are competing for while a snapshot compresses
+COMPRESS_LEVEL = 1
+# How often the scheduler checks whether a tenant's newest snapshot is due
+SCHEDULER_POLL_SECONDS = 600
+
+SNAPSHOT_FORMAT = '%Y%m%dT%H%M%SZ'
+_SNAPSHOT_NAME = re.compile(r'^(\d{8}T\d{6}Z)(?:-(\d+))?\.db\.gz$')
+
+LOCK_NAME = '.lock'
+
+logger = logging.getLogger('billprepared.backup')
+_scheduler = None
+
+
+class BackupError(ValueError):
+    """An invalid restore request"""
+
+
+class SnapshotNotFound(BackupError):
+    """No snapshot matches a restore request"""
+
+
+def backup_dir(tenant):
+    if not valid_tenant(tenant):
+        raise ValueError(f'Invalid tenant id: {tenant!r}')
+    return os.path.join(BACKUP_DIR, tenant)
+
+
+def snapshots(tenant=None):
+    """A tenant's snapshots, oldest first: dicts with name, path, created_at and size"""
+    directory = backup_dir(tenant or current_tenant())
+    found = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        match = _SNAPSHOT_NAME.match(name)
+        if match:
+            created = datetime.strptime(match.group(1), SNAPSHOT_FORMAT).replace(tzinfo=timezone.utc)
+            path = os.path.join(directory, name)
+            found.append({'name': name, 'path': path, 'created_at': created,
+                          'size': os.path.getsize(path), '_order': (created, int(match.group(2) or 0))})
+    found.sort(key=lambda snapshot: snapshot['_order'])
+    for snapshot in found:
+        del snapshot['_order']
+    return found
+
+
+def describe(snapshot):
+    """JSON-friendly form of a snapshot"""
+    return {'name': snapshot['name'], 'created_at': snapshot['created_at'].isoformat(), 'size': snapshot['size']}
+
+
+@contextlib.contextmanager
+def _locked(tenant):
+    """Hold a tenant's backup lock (see module docstring).
+
+    Snapshot names are picked under it, so they can't collide.
+    """
+    directory = backup_dir(tenant)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield directory
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def copy_database(source, target_path, pages=BACKUP_PAGES, pause=BACKUP_PAUSE_SECONDS):
+    """Copy the database open on `source` into a new file; returns its page count"""
+    total = [0]
+
+    def progress(status, remaining, count):
+        total[0] = count
+        if remaining and pause:
+            time.sleep(pause)
+
+    target = sqlite3.connect(target_path)
+    try:
+        # Pin one snapshot of the source for every step (see module docstring)
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        finally:
+            source.rollback()
+        # A self-contained file: no -wal sidecar when it is opened later
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+    return total[0]
+
+
+def _compress(path, target_path):
+    with open(path, 'rb') as raw, gzip.open(target_path, 'wb', compresslevel=COMPRESS_LEVEL) as out:
+        shutil.copyfileobj(raw, out, 1 << 20)
+
+
+def _new_path(directory, created):
+    """New snapshot path for a timestamp; same-second snapshots get an increasing counter suffix"""
+    stamp = created.strftime(SNAPSHOT_FORMAT)
+    taken = [int(match.group(2) or 0) for match in map(_SNAPSHOT_NAME.match, os.listdir(directory))
+             if match and match.group(1) == stamp]
+    suffix = f'-{max(taken) + 1}' if taken else ''
+    return os.path.join(directory, f'{stamp}{suffix}.db.gz')
+
+
+def prune(tenant, keep=BACKUP_KEEP):
+    """Delete all but a tenant's newest `keep` snapshots; returns the deleted names"""
+    with _locked(tenant):
+        return _prune(tenant, keep)
+
+
+def _prune(tenant, keep):
+    """prune() with the tenant's lock already held"""
+    old = snapshots(tenant)[:-keep] if keep > 0 else []
+    for snapshot in old:
+        os.remove(snapshot['path'])
+    return [snapshot['name'] for snapshot in old]
+
+
+def backup(tenant=None, keep=BACKUP_KEEP, pages=BACKUP_PAGES, pause=BACKUP_PAUSE_SECONDS):
+    """Snapshot a tenant's database (default: the current tenant).
+
+    keep=None skips rotation. Returns the snapshot plus timing and size figures.
+    """
+    tenant = tenant or current_tenant()
+    with _locked(tenant):
+        return _backup(tenant, keep, pages, pause)
+
+
+def _temp_path(directory, suffix):
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=directory)
+    os.close(fd)
+    return path
+
+
+def _backup(tenant, keep, pages, pause):
+    """backup() with the tenant's lock already held"""
+    directory = backup_dir(tenant)
+    start = time.perf_counter()
+    created = datetime.now(timezone.utc).replace(microsecond=0)
+    path = _new_path(directory, created)
+    copy_path, part_path = _temp_path(directory, '.copy'), _temp_path(directory, '.part')
+    source = connect(tenant)
+    try:
+        migrate(source)
+        page_count = copy_database(source, copy_path, pages, pause)
+        copied = time.perf_counter()
+        _compress(copy_path, part_path)
+        database_size, size = os.path.getsize(copy_path), os.path.getsize(part_path)
+        os.replace(part_path, path)
+    finally:
+        source.close()
+        for leftover in (copy_path, part_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    pruned = _prune(tenant, keep) if keep is not None else []
+    return {
+        'tenant': tenant,
+        'name': os.path.basename(path),
+        'created_at': created.isoformat(),
+        'pages': page_count,
+        'database_size': database_size,
+        'size': size,
+        'copy_seconds': round(copied - start, 3),
+        'seconds': round(time.perf_counter() - start, 3),
+        'pruned': pruned,
+    }
+
+
+def _parse_time(value):
+    """Point in time from an ISO date or datetime; naive values are UTC"""
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            raise BackupError(f'Invalid point in time: {value!r} (expected an ISO date or datetime)')
+        if len(str(value)) == 10:
+            moment += timedelta(days=1, microseconds=-1)  # A bare date means the end of that day
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def find_snapshot(tenant=None, at=None, name=None):
+    """The named snapshot, else the newest taken at or before `at` (default: the newest)"""
+    available = snapshots(tenant)
+    if name is not None:
+        match = next((snapshot for snapshot in available if snapshot['name'] == name), None)
+        if match is None:
+            raise SnapshotNotFound(f'No snapshot named {name}')
+        return match
+    if at is not None:
+        moment = _parse_time(at)
+        available = [snapshot for snapshot in available if snapshot['created_at'] <= moment]
+    if not available:
+        raise SnapshotNotFound('No snapshot at or before that time' if at is not None else 'No snapshots')
+    return available[-1]
+
+
+def _counters(conn):
+    version = conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return (version[0] if version else 0), (seq[0] if seq else 0)
+
+
+def restore(tenant=None, at=None, name=None, keep=BACKUP_KEEP):
+    """Replace a tenant's database with a snapshot (see find_snapshot).
+
+    The current state is snapshotted first. Returns the restored and the
+    safety snapshot.
+    """
+    tenant = tenant or current_tenant()
+    # Held throughout, so no backup or rotation runs while the live file is replaced
+    with _locked(tenant):
+        return _restore(tenant, at, name, keep)
+
+
+def _restore(tenant, at, name, keep):
+    """restore() with the tenant's lock already held"""
+    snapshot = find_snapshot(tenant, at, name)
+    safety = _backup(tenant, None, BACKUP_PAGES, BACKUP_PAUSE_SECONDS)
+    work_path = _temp_path(backup_dir(tenant), '.restore')
+    try:
+        with gzip.open(snapshot['path'], 'rb') as packed, open(work_path, 'wb') as out:
+            shutil.copyfileobj(packed, out, 1 << 20)
+        work = sqlite3.connect(work_path)
+        live = connect(tenant)
+        try:
+            migrate(work)  # Snapshots taken before a schema upgrade
+            live_version, live_seq = _counters(live)
+            version, seq = _counters(work)
+            # New ETags and change feed cursors: every client refetches
+            work.execute('UPDATE data_version SET version = ? WHERE id = 1', (max(version, live_version) + 1,))
+            work.execute('DELETE FROM change_log')
+            if work.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'",
+                            (max(seq, live_seq) + 1,)).rowcount == 0:
+                work.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (max(seq, live_seq) + 1,))
+            work.commit()
+            # One step: the live database is locked while it is overwritten,
+            # and no request sees it half-restored
+            work.backup(live)
+        finally:
+            work.close()
+            live.close()
+    finally:
+        for path in (work_path, work_path + '-wal', work_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    if keep is not None:
+        _prune(tenant, keep)
+    return {'tenant': tenant, 'restored': describe(snapshot), 'safety_snapshot': safety['name']}
+
+
+def backup_due(tenant, interval_hours, now=None):
+    """Whether a tenant's newest snapshot is older than the interval"""
+    existing = snapshots(tenant)
+    now = now or datetime.now(timezone.utc)
+    return not existing or now - existing[-1]['created_at'] >= timedelta(hours=interval_hours)
+
+
+def run_scheduled(interval_hours=BACKUP_INTERVAL_HOURS):
+    """Back up every tenant whose newest snapshot is due; returns the results"""
+    results = []
+    for tenant in tenants():
+        try:
+            if not backup_due(tenant, interval_hours):
+                continue
+            with _locked(tenant):
+                # Another worker may have taken it while this one waited for the lock
+                if backup_due(tenant, interval_hours):
+                    results.append(_backup(tenant, BACKUP_KEEP, BACKUP_PAGES, BACKUP_PAUSE_SECONDS))
+        except Exception:
+            logger.exception('Scheduled backup of tenant %s failed', tenant)
+    return results
+
+
+def _scheduler_loop(interval_hours):
+    while True:
+        run_scheduled(interval_hours)
+        time.sleep(min(SCHEDULER_POLL_SECONDS, interval_hours * 3600))
+
+
+def start_scheduler(interval_hours=BACKUP_INTERVAL_HOURS):
+    """Start the background backup thread (once per process).
+
+    Every gunicorn worker runs one. Due-ness is judged from the snapshots on
+    disk and re-checked under the tenant's lock, so restarts and several
+    workers sharing BACKUP_DIR take one snapshot per interval between them.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = threading.Thread(target=_scheduler_loop, args=(interval_hours,),
+                                      name='billprepared-backup', daemon=True)
+        _scheduler.start()
+    return _scheduler
+
+
+def init_app(app):
+    """Start scheduled backups if BACKUP_INTERVAL_HOURS is set"""
+    if BACKUP_INTERVAL_HOURS > 0:
+        start_scheduler()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Take, list or restore snapshot backups')
+    parser.add_argument('--keep', type=int, default=BACKUP_KEEP)
+    parser.add_argument('--pages', type=int, default=BACKUP_PAGES, help='pages copied per step')
+    parser.add_argument('--pause', type=float, default=BACKUP_PAUSE_SECONDS, help='seconds between steps')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--list', action='store_true', help='list snapshots instead of taking one')
+    action.add_argument('--restore', metavar='TIME', help="restore the newest snapshot at or before TIME ('latest' for the newest)")
+    action.add_argument('--snapshot', metavar='NAME', help='restore the named snapshot')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--tenant', default=DEFAULT_TENANT)
+    group.add_argument('--all-tenants', action='store_true')
+    args = parser.parse_args()
+
+    for tenant in tenants() if args.all_tenants else [args.tenant]:
+        if args.list:
+            for snapshot in snapshots(tenant):
+                print(f"{tenant}: {snapshot['name']}  {snapshot['size']:>12,d} bytes")
+        elif args.restore or args.snapshot:
+            at = None if args.restore in (None, 'latest') else args.restore
+            try:
+                result = restore(tenant, at=at, name=args.snapshot, keep=args.keep)
+            except BackupError as e:
+                parser.error(f'{tenant}: {e}')
+            print(f"{tenant}: restored {result['restored']['name']} "
+                  f"(previous state saved as {result['safety_snapshot']})")
+        else:
+            result = backup(tenant, args.keep, args.pages, args.pause)
+            print(f"{tenant}: {result['name']} {result['database_size']:,d} -> {result['size']:,d} bytes "
+                  f"in {result['seconds']:.2f}s (copy {result['copy_seconds']:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
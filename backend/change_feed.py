@@ -0,0 +1,185 @@
+"""Change feed over the change_log table.
+
+Triggers (see database.init_db) append a row to change_log for every insert,
+update and delete on the versioned tables. changes_since() turns the log into
+coalesced deltas carrying the current row for inserts/updates, which the
+frontend applies instead of reloading its whole transaction window.
+stream_changes() serves the same deltas as Server-Sent Events.
+
+Entries older than CHANGE_LOG_RETENTION_DAYS, or beyond the newest
+CHANGE_LOG_MAX_ROWS, are compacted away. Successful writes trigger this (at
+most once per COMPACT_INTERVAL_SECONDS), so the log stays bounded even when
+no client reads it; archive.compact runs it too. A client asking for changes
+from before the oldest retained entry gets {"reset": true} and must refetch.
+"""
+import json
+import os
+import threading
+import time
+
+from flask import request
+
+from database import get_db, current_tenant, VERSIONED_TABLES
+
+CHANGE_LOG_RETENTION_DAYS = 7
+CHANGE_LOG_MAX_ROWS = 100000
+COMPACT_INTERVAL_SECONDS = 3600
+DEFAULT_LIMIT = 5000
+
+POLL_INTERVAL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+STREAM_MAX_SECONDS = 300
+# Every open stream holds a server thread (gunicorn gthread: --threads per
+# worker). Past this many per process /api/changes/stream answers 503 and
+# clients poll /api/changes instead, leaving threads for ordinary requests.
+MAX_STREAMS = int(os.environ.get('BILLPREPARED_MAX_STREAMS', '4'))
+
+_streams = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Where a table's current rows are read from. A transaction archived since it
+# changed still exists (archiving logs no delete), so read through the view
+ROW_SOURCES = {'transactions': 'all_transactions'}
+
+# Monotonic time of the last compaction, per tenant
+_last_compaction = {}
+
+
+def latest_seq(conn):
+    """Return the sequence number of the most recent change (0 if none)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    return row[0] if row else 0
+
+
+def compact_change_log(conn, retention_days=CHANGE_LOG_RETENTION_DAYS, max_rows=CHANGE_LOG_MAX_ROWS):
+    """Delete old change log entries, returning how many were removed"""
+    latest = latest_seq(conn)
+    cursor = conn.execute(
+        "DELETE FROM change_log WHERE seq <= ? OR created_at < datetime('now', ?)",
+        (latest - max_rows, f'-{retention_days} days')
+    )
+    return cursor.rowcount
+
+
+def maybe_compact(conn):
+    """Compact a tenant's change log at most once per COMPACT_INTERVAL_SECONDS per process"""
+    tenant = current_tenant()
+    now = time.monotonic()
+    if now - _last_compaction.get(tenant, -COMPACT_INTERVAL_SECONDS) < COMPACT_INTERVAL_SECONDS:
+        return
+    _last_compaction[tenant] = now
+    compact_change_log(conn, CHANGE_LOG_RETENTION_DAYS, CHANGE_LOG_MAX_ROWS)
+    conn.commit()
+
+
+def compact_after_write(response):
+    """after_request hook: every write appends to the change log, so writes
+    keep it compacted whether or not anyone reads the feed"""
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        maybe_compact(get_db())
+    return response
+
+
+def init_app(app):
+    """Register change log compaction on a Flask app"""
+    app.after_request(compact_after_write)
+
+
+def _fetch_rows(conn, table, ids):
+    table = ROW_SOURCES.get(table, table)
+    rows = {}
+    ids = list(ids)
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        placeholders = ','.join('?' * len(chunk))
+        for row in conn.execute(f'SELECT * FROM {table} WHERE id IN ({placeholders})', chunk).fetchall():
+            rows[row['id']] = dict(row)
+    return rows
+
+
+def changes_since(conn, since, limit=DEFAULT_LIMIT):
+    """Return coalesced changes after `since`.
+
+    Result: {'seq': <last seq covered>, 'reset': bool, 'more': bool,
+    'changes': [{'seq', 'table', 'op', 'id', 'row'}]}. Several changes to the
+    same row collapse into one entry; 'row' is the row's current state
+    (None for deletes).
+    """
+    latest = latest_seq(conn)
+    if since >= latest:
+        return {'seq': latest, 'reset': False, 'more': False, 'changes': []}
+
+    oldest = conn.execute('SELECT MIN(seq) FROM change_log').fetchone()[0]
+    if oldest is None or since + 1 < oldest:
+        return {'seq': latest, 'reset': True, 'more': False, 'changes': []}
+
+    log = conn.execute(
+        'SELECT seq, table_name, row_id, op FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?',
+        (since, limit)
+    ).fetchall()
+
+    # (table, id) -> [last seq, first op]
+    touched = {}
+    for seq, table, row_id, op in log:
+        entry = touched.get((table, row_id))
+        if entry is None:
+            touched[(table, row_id)] = [seq, op]
+        else:
+            entry[0] = seq
+
+    by_table = {}
+    for (table, row_id), (seq, first_op) in touched.items():
+        if table in VERSIONED_TABLES:
+            by_table.setdefault(table, []).append(row_id)
+    current = {table: _fetch_rows(conn, table, ids) for table, ids in by_table.items()}
+
+    changes = []
+    for (table, row_id), (seq, first_op) in touched.items():
+        row = current.get(table, {}).get(row_id)
+        if row is None:
+            if first_op == 'insert':
+                continue  # Created and deleted within the window
+            op = 'delete'
+        else:
+            op = 'insert' if first_op == 'insert' else 'update'
+        changes.append({'seq': seq, 'table': table, 'op': op, 'id': row_id, 'row': row})
+    changes.sort(key=lambda c: c['seq'])
+
+    last = log[-1]['seq'] if log else latest
+    return {'seq': last, 'reset': False, 'more': last < latest, 'changes': changes}
+
+
+def acquire_stream():
+    """Reserve a stream slot; False when MAX_STREAMS streams are already open"""
+    return _streams.acquire(blocking=False)
+
+
+def release_stream():
+    _streams.release()
+
+
+def _event(name, payload, seq):
+    return f'id: {seq}\nevent: {name}\ndata: {json.dumps(payload)}\n\n'
+
+
+def stream_changes(since=None):
+    """Generate Server-Sent Events for changes after `since` (default: from now)"""
+    conn = get_db()
+    maybe_compact(conn)
+    if since is None:
+        since = latest_seq(conn)
+    started = last_sent = time.monotonic()
+    yield 'retry: 2000\n'
+    yield _event('ready', {'seq': since}, since)
+    while time.monotonic() - started < STREAM_MAX_SECONDS:
+        if latest_seq(conn) > since:
+            more = True
+            while more:
+                payload = changes_since(conn, since)
+                since, more = payload['seq'], payload['more']
+                yield _event('changes', payload, since)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > HEARTBEAT_SECONDS:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(POLL_INTERVAL_SECONDS)
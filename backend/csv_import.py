@@ -0,0 +1,416 @@
+"""CSV ingestion for bank statement imports.
+
+The layout of a statement (delimiter, header row, column order, date format
+and amount style) is detected once from a sample of the first rows, then a
+row parser specialised for that layout is compiled and run over the whole
+file. Every format in database.VALIDATED_FORMATS is accepted.
+"""
+import csv
+import io
+import re
+from datetime import date
+
+from database import VALIDATED_FORMATS, to_day
+
+SAMPLE_SIZE = 50
+
+MONTHS = {}
+for _number, _name in enumerate(['january', 'february', 'march', 'april', 'may', 'june', 'july',
+                                 'august', 'september', 'october', 'november', 'december'], start=1):
+    MONTHS[_name] = _number
+    MONTHS[_name[:3]] = _number
+MONTHS['sept'] = 9
+
+# Header keywords used to locate columns when the file has a header row, in
+# priority order: an exact 'description' column beats a 'reference' one
+HEADER_KEYWORDS = {
+    'date': ('date', 'posted', 'transaction date', 'value date'),
+    'amount': ('amount', 'value', 'amt'),
+    'debit': ('debit', 'withdrawal', 'withdrawals', 'paid out', 'money out', 'out'),
+    'credit': ('credit', 'deposit', 'deposits', 'paid in', 'money in', 'in'),
+    'description': ('description', 'details', 'narrative', 'memo', 'payee', 'merchant', 'reference', 'name'),
+}
+
+_DECIMAL_COMMA = re.compile(r'^[^\d]*-?[\d.\s]*\d,\d{1,2}[^\d]*$')
+_AMOUNT_JUNK = re.compile(r'[^\d.,()\-+]')
+_WHOLE_NUMBER = re.compile(r'^\d+$')
+_FRACTION_OR_SIGN = re.compile(r'[.,]\d{1,2}\D*$|[-+(]')
+
+
+class CSVFormatError(ValueError):
+    """Raised when the layout of a CSV file cannot be detected"""
+
+
+def _two_digit_year(yy):
+    # Same pivot as strptime's %y: 69-99 -> 1900s, 00-68 -> 2000s
+    return yy + (1900 if yy >= 69 else 2000)
+
+
+def _month(name):
+    return MONTHS[name.strip().rstrip('.').lower()]
+
+
+def _numeric_date_parser(sep, year, month, day):
+    """Build a parser for numeric formats given the index of each part"""
+    def parse(value):
+        parts = value.strip().split(sep)
+        if len(parts) != 3 or len(parts[year]) != 4:
+            raise ValueError(value)
+        return date(int(parts[year]), int(parts[month]), int(parts[day]))
+    return parse
+
+
+def _parse_mmm_dd_yyyy(value):
+    parts = value.replace(',', ' ').split()
+    if len(parts) != 3 or len(parts[2]) != 4:
+        raise ValueError(value)
+    return date(int(parts[2]), _month(parts[0]), int(parts[1]))
+
+
+def _parse_dd_mmmm_yyyy(value):
+    parts = value.strip().split('-')
+    if len(parts) != 3 or len(parts[2]) != 4:
+        raise ValueError(value)
+    return date(int(parts[2]), _month(parts[1]), int(parts[0]))
+
+
+def _parse_dd_mmm_yy(value):
+    parts = value.strip().split('-')
+    if len(parts) != 3 or len(parts[2]) != 2:
+        raise ValueError(value)
+    return date(_two_digit_year(int(parts[2])), _month(parts[1]), int(parts[0]))
+
+
+DATE_PARSERS = {
+    'MM/DD/YYYY': _numeric_date_parser('/', 2, 0, 1),
+    'DD/MM/YYYY': _numeric_date_parser('/', 2, 1, 0),
+    'YYYY-MM-DD': _numeric_date_parser('-', 0, 1, 2),
+    'DD-MM-YYYY': _numeric_date_parser('-', 2, 1, 0),
+    'MMM DD, YYYY': _parse_mmm_dd_yyyy,
+    'DD-MMMM-YYYY': _parse_dd_mmmm_yyyy,
+    'DD-MMM-YY': _parse_dd_mmm_yy,
+}
+assert set(DATE_PARSERS) == set(VALIDATED_FORMATS)
+
+# Formats are tried in this order; ties between ambiguous formats go to the
+# earliest, so DD/MM/YYYY (the original import format) wins over MM/DD/YYYY.
+DATE_FORMAT_PRIORITY = ['DD/MM/YYYY'] + [f for f in VALIDATED_FORMATS if f != 'DD/MM/YYYY']
+
+
+def _parse_plain_amount(value):
+    return float(value.strip('"'))
+
+
+def _clean_amount(value, decimal_comma):
+    value = value.strip()
+    negative = value.startswith('(') and value.endswith(')') or value.endswith('-')
+    value = _AMOUNT_JUNK.sub('', value).strip('()+')
+    if value.endswith('-'):
+        value = value[:-1]
+    if decimal_comma:
+        value = value.replace('.', '').replace(',', '.')
+    else:
+        value = value.replace(',', '')
+    amount = float(value)
+    return -abs(amount) if negative else amount
+
+
+def _parse_thousands_amount(value):
+    return _clean_amount(value, False)
+
+
+def _parse_decimal_comma_amount(value):
+    return _clean_amount(value, True)
+
+
+AMOUNT_PARSERS = {
+    'plain': _parse_plain_amount,
+    'thousands': _parse_thousands_amount,
+    'decimal_comma': _parse_decimal_comma_amount,
+}
+
+
+def _detect_amount_style(values):
+    """Pick the amount parser that accepts the most sampled values (ties go to
+    the cheapest), or None if it accepts fewer than half of them"""
+    values = [v for v in values if v.strip()]
+    if not values:
+        return None
+    best, best_parsed = None, 0
+    for style in ('plain', 'thousands', 'decimal_comma'):
+        if style == 'thousands' and any(_DECIMAL_COMMA.match(v) for v in values):
+            continue
+        parser = AMOUNT_PARSERS[style]
+        parsed = sum(1 for v in values if _safe_parses(parser, v))
+        if parsed > best_parsed:
+            best, best_parsed = style, parsed
+    return best if best_parsed * 2 >= len(values) else None
+
+
+def _is_identifier(values):
+    """Whether a numeric column looks like a reference number rather than an amount:
+    unsigned whole numbers that strictly increase (or decrease) row by row"""
+    values = [v.strip() for v in values if v.strip()]
+    if len(values) < 2 or not all(_WHOLE_NUMBER.match(v) for v in values):
+        return False
+    numbers = [int(v) for v in values]
+    pairs = list(zip(numbers, numbers[1:]))
+    return all(a < b for a, b in pairs) or all(a > b for a, b in pairs)
+
+
+def _has_fraction_or_sign(values):
+    return any(_FRACTION_OR_SIGN.search(v.strip()) for v in values)
+
+
+def _detect_delimiter(lines):
+    best, best_width = ',', 0
+    for delimiter in (',', ';', '\t', '|'):
+        widths = [len(row) for row in csv.reader(lines, delimiter=delimiter) if row]
+        if not widths:
+            continue
+        width = max(set(widths), key=widths.count)
+        if width >= 3 and width > best_width and widths.count(width) >= len(widths) * 0.8:
+            best, best_width = delimiter, width
+    return best
+
+
+def _match_header(header, role):
+    """Column named by the role's highest-priority keyword present in the header"""
+    names = [name.strip().lower() for name in header]
+    for keyword in HEADER_KEYWORDS[role]:
+        if keyword in names:
+            return names.index(keyword)
+    return None
+
+
+def _detect_date_column(rows, width):
+    """Return (column, format) maximising the number of parsed sample dates"""
+    best = None
+    for column in range(width):
+        values = [row[column] for row in rows if len(row) > column and row[column].strip()]
+        if not values:
+            continue
+        for rank, fmt in enumerate(DATE_FORMAT_PRIORITY):
+            parser = DATE_PARSERS[fmt]
+            parsed = 0
+            for value in values:
+                try:
+                    parser(value)
+                    parsed += 1
+                except (ValueError, KeyError):
+                    pass
+            key = (parsed, -column, -rank)
+            if parsed and (best is None or key > best[0]):
+                best = (key, column, fmt)
+    if best is None:
+        return None, None
+    return best[1], best[2]
+
+
+def _letter_score(rows, column):
+    values = [row[column] for row in rows if len(row) > column]
+    if not values:
+        return 0
+    return sum(sum(ch.isalpha() for ch in v) for v in values) / len(values)
+
+
+def detect_layout(rows):
+    """Detect the layout of a statement from its first rows.
+
+    Returns a dict with the header flag, column indexes, date format and
+    amount style, suitable for compile_row_parser, or None when the sample
+    is only a header row.
+    """
+    rows = [row for row in rows if any(cell.strip() for cell in row)]
+    if not rows:
+        raise CSVFormatError('CSV file is empty')
+    width = max(len(row) for row in rows)
+
+    # A first row whose cells are not dates in any format is a header
+    first = rows[0]
+    has_header = all(
+        not _safe_parses(parser, cell) for cell in first for parser in DATE_PARSERS.values()
+    )
+    header = [cell.strip().lower() for cell in first] if has_header else []
+    data = rows[1:] if has_header else rows
+    if not data:
+        return None
+
+    date_column, date_format = None, None
+    if header:
+        date_column = _match_header(header, 'date')
+    if date_column is not None:
+        _, date_format = _detect_date_column([[row[date_column]] if len(row) > date_column else [] for row in data], 1)
+    if date_format is None:
+        date_column, date_format = _detect_date_column(data, width)
+    if date_format is None:
+        raise CSVFormatError(f'Could not detect a date column in any of {VALIDATED_FORMATS}')
+
+    used = {date_column}
+    layout = {
+        'has_header': has_header,
+        'date_column': date_column,
+        'date_format': date_format,
+        'amount_column': None,
+        'debit_column': None,
+        'credit_column': None,
+        'amount_style': None,
+        'description_column': None,
+    }
+
+    def column_values(column):
+        return [row[column] for row in data if len(row) > column]
+
+    # Amount: explicit header first, then debit/credit headers, then content
+    amount_column = _match_header(header, 'amount') if header else None
+    debit_column = _match_header(header, 'debit') if header else None
+    credit_column = _match_header(header, 'credit') if header else None
+    if amount_column is None and debit_column is not None and credit_column is not None:
+        style = _detect_amount_style(column_values(debit_column) + column_values(credit_column))
+        layout.update(debit_column=debit_column, credit_column=credit_column, amount_style=style)
+        used.update((debit_column, credit_column))
+    else:
+        numeric = []
+        for column in range(width):
+            if column in used:
+                continue
+            values = column_values(column)
+            style = _detect_amount_style(values)
+            if style is not None:
+                filled = sum(1 for v in values if v.strip())
+                numeric.append((column, style, filled == len(values)))
+        # Reference numbers parse as amounts too; drop them unless nothing else does
+        numeric = [n for n in numeric if not _is_identifier(column_values(n[0]))] or numeric
+        if amount_column is not None:
+            style = _detect_amount_style(column_values(amount_column))
+            layout.update(amount_column=amount_column, amount_style=style)
+            used.add(amount_column)
+        else:
+            complete = [n for n in numeric if n[2]]
+            if len(complete) > 1:
+                # Amounts carry pence or a sign; whole-number columns are counts or references
+                complete = [n for n in complete if _has_fraction_or_sign(column_values(n[0]))] or complete
+            if len(complete) > 1:
+                raise CSVFormatError('Several columns could be the amount (columns '
+                                     f'{", ".join(str(n[0] + 1) for n in complete)}); add a header row '
+                                     "naming the 'amount' column")
+            if complete:
+                column, style, _ = complete[0]
+                layout.update(amount_column=column, amount_style=style)
+                used.add(column)
+            elif len(numeric) >= 2 and _mutually_exclusive(data, numeric[0][0], numeric[1][0]):
+                # Headerless debit/credit pair: banks list debits first
+                debit_column, credit_column = numeric[0][0], numeric[1][0]
+                style = _detect_amount_style(column_values(debit_column) + column_values(credit_column))
+                layout.update(debit_column=debit_column, credit_column=credit_column, amount_style=style)
+                used.update((debit_column, credit_column))
+    if layout['amount_style'] is None:
+        raise CSVFormatError('Could not detect an amount column')
+
+    description_column = _match_header(header, 'description') if header else None
+    if description_column is None or description_column in used:
+        remaining = [c for c in range(width) if c not in used]
+        if not remaining:
+            raise CSVFormatError('Could not detect a description column')
+        description_column = max(remaining, key=lambda c: (_letter_score(data, c), -c))
+    layout['description_column'] = description_column
+    return layout
+
+
+def _safe_parses(parser, value):
+    try:
+        parser(value)
+        return True
+    except (ValueError, KeyError):
+        return False
+
+
+def _mutually_exclusive(rows, a, b):
+    for row in rows:
+        has_a = len(row) > a and bool(row[a].strip())
+        has_b = len(row) > b and bool(row[b].strip())
+        if has_a == has_b:
+            return False
+    return True
+
+
+def compile_row_parser(layout):
+    """Build a row -> dict function specialised for a detected layout.
+
+    The returned function raises ValueError (or KeyError/IndexError) for rows
+    that don't fit the layout; callers skip those rows. Statements repeat the
+    same date on many rows, so parsed dates are memoised per file.
+    """
+    parse_format = DATE_PARSERS[layout['date_format']]
+    dates = {}
+
+    def parse_date(value):
+        parsed = dates.get(value)
+        if parsed is None:
+            d = parse_format(value)
+            parsed = dates[value] = (d.isoformat(), to_day(d))
+        return parsed
+    parse_amount = AMOUNT_PARSERS[layout['amount_style']]
+    date_column = layout['date_column']
+    description_column = layout['description_column']
+
+    if layout['amount_column'] is not None:
+        amount_column = layout['amount_column']
+
+        def parse_row(row):
+            iso, day = parse_date(row[date_column])
+            return {
+                'date': iso,
+                'day': day,
+                'amount': parse_amount(row[amount_column]),
+                'description': row[description_column].strip()
+            }
+    else:
+        debit_column = layout['debit_column']
+        credit_column = layout['credit_column']
+
+        def parse_row(row):
+            iso, day = parse_date(row[date_column])
+            debit = row[debit_column].strip()
+            credit = row[credit_column].strip()
+            if not debit and not credit:
+                raise ValueError('Row has neither debit nor credit')
+            amount = (parse_amount(credit) if credit else 0.0) - (abs(parse_amount(debit)) if debit else 0.0)
+            return {
+                'date': iso,
+                'day': day,
+                'amount': amount,
+                'description': row[description_column].strip()
+            }
+    return parse_row
+
+
+def parse_csv(text, sample_size=SAMPLE_SIZE):
+    """Parse a bank statement into a list of {date, day, amount, description} dicts"""
+    lines = text.splitlines()
+    sample_lines = [line for line in lines[:sample_size * 2] if line.strip()][:sample_size]
+    if not sample_lines:
+        return []
+    delimiter = _detect_delimiter(sample_lines)
+    layout = detect_layout(list(csv.reader(sample_lines, delimiter=delimiter)))
+    if layout is None:
+        return []
+    parse_row = compile_row_parser(layout)
+    min_width = max(c for c in (layout['date_column'], layout['amount_column'], layout['debit_column'],
+                                layout['credit_column'], layout['description_column']) if c is not None) + 1
+
+    reader = csv.reader(io.StringIO(text, newline=None), delimiter=delimiter)
+    if layout['has_header']:
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                break
+    transactions = []
+    append = transactions.append
+    for row in reader:
+        if len(row) < min_width:
+            continue
+        try:
+            append(parse_row(row))
+        except (ValueError, KeyError):
+            continue
+    return transactions
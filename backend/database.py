@@ -1,5 +1,11 @@
+import argparse
+import json
+import re
 import sqlite3
-from datetime import datetime
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, date
 
 VALIDATED_FORMATS = [
     'MM/DD/YYYY',
@@ -12,89 +18,503 @@ VALIDATED_FORMATS = [
 ]
 
 import os
-DATABASE = os.path.join(os.path.dirname(__file__), 'data', 'budget.db')
-
-def get_db():
-    print(f"DEBUG: Attempting to connect to database at: {DATABASE}")
-    print(f"DEBUG: Current working directory: {os.getcwd()}")
-    print(f"DEBUG: File location: {__file__}")
-    print(f"DEBUG: Directory writable? {os.access(os.path.dirname(DATABASE), os.W_OK)}")
-    conn = sqlite3.connect(DATABASE)
+import instrumentation
+DATABASE = os.environ.get('BILLPREPARED_DB', os.path.join(os.path.dirname(__file__), 'data', 'budget.db'))
+
+# Transactions keep an integer day number (days since 1970-01-01) next to the
+# ISO date string so range filters and date arithmetic are plain integer ops.
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# julianday('1970-01-01') in SQLite, used to backfill the day column in SQL
+_EPOCH_JULIANDAY = 2440587.5
+
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD string; anything else (times, trailing text) is a ValueError"""
+    if not _ISO_DATE.fullmatch(value):
+        raise ValueError(f'Not a YYYY-MM-DD date: {value!r}')
+    return date.fromisoformat(value)
+
+# strptime equivalents of VALIDATED_FORMATS, DD/MM/YYYY (the original import
+# format) first, for reading dates stored before they were validated
+LEGACY_DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%b %d, %Y', '%d-%B-%Y', '%d-%b-%y']
+
+def parse_legacy_date(value):
+    """Parse a stored date in any validated format, ignoring a trailing time
+    after an ISO date; anything else is a ValueError"""
+    value = value.strip()
+    if _ISO_DATE.match(value):
+        return parse_date(value[:10])
+    for fmt in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'Not a date in any supported format: {value!r}')
+
+def to_day(value):
+    """Convert a YYYY-MM-DD string (or date/datetime) to an epoch day number"""
+    if isinstance(value, str):
+        value = parse_date(value)
+    elif isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() - _EPOCH_ORDINAL
+
+def from_day(day):
+    """Convert an epoch day number back to a YYYY-MM-DD string"""
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+# Tenants: each household's ledger lives in its own SQLite file under
+# TENANT_DIR. The default tenant keeps DATABASE, so single-household installs
+# are unchanged.
+DEFAULT_TENANT = 'default'
+TENANT_DIR = os.environ.get('BILLPREPARED_TENANT_DIR', os.path.join(os.path.dirname(DATABASE), 'tenants'))
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+# Tenants provisioned at startup (comma-separated ids). Others are created with
+# `python database.py --create-tenant <id>`; requests never create shards.
+CONFIGURED_TENANTS = [tenant.strip() for tenant in os.environ.get('BILLPREPARED_TENANTS', '').split(',') if tenant.strip()]
+# Connections kept open per thread; the least recently used one is closed first
+MAX_OPEN_CONNECTIONS = int(os.environ.get('BILLPREPARED_MAX_CONNECTIONS', '16'))
+
+_current_tenant = ContextVar('billprepared_tenant', default=DEFAULT_TENANT)
+_local = threading.local()
+# Database files migrated by this process, so get_db only migrates a shard once
+_migrated = set()
+_connection_logged = False
+
+class UnknownTenant(LookupError):
+    """A tenant id that has not been provisioned (see create_tenant)"""
+
+def valid_tenant(tenant):
+    return tenant == DEFAULT_TENANT or bool(TENANT_ID_PATTERN.match(tenant))
+
+def current_tenant():
+    return _current_tenant.get()
+
+def set_tenant(tenant):
+    """Make `tenant` the target of get_db() in the current context"""
+    if not valid_tenant(tenant):
+        raise ValueError(f'Invalid tenant id: {tenant!r}')
+    _current_tenant.set(tenant)
+
+def database_path(tenant=None):
+    """Path of a tenant's database file (default: the current tenant)"""
+    tenant = tenant or current_tenant()
+    if tenant == DEFAULT_TENANT:
+        return DATABASE
+    if not valid_tenant(tenant):
+        raise ValueError(f'Invalid tenant id: {tenant!r}')
+    return os.path.join(TENANT_DIR, f'{tenant}.db')
+
+def tenant_exists(tenant):
+    """Whether a tenant has been provisioned (the default tenant always has)"""
+    path = database_path(tenant)
+    return tenant == DEFAULT_TENANT or path in _migrated or os.path.exists(path)
+
+def _require(tenant):
+    """Path of an existing tenant's database; raises UnknownTenant otherwise"""
+    tenant = tenant or current_tenant()
+    if not tenant_exists(tenant):
+        raise UnknownTenant(f'Unknown tenant: {tenant}')
+    return database_path(tenant)
+
+def _open(path):
+    global _connection_logged
+    if not _connection_logged:
+        # Only print the path diagnostics once per process, not on every connection
+        _connection_logged = True
+        print(f"DEBUG: Attempting to connect to database at: {path}")
+        print(f"DEBUG: Current working directory: {os.getcwd()}")
+        print(f"DEBUG: File location: {__file__}")
+        print(f"DEBUG: Directory writable? {os.access(os.path.dirname(path), os.W_OK)}")
+    if instrumentation.ENABLED:
+        conn = sqlite3.connect(path, factory=instrumentation.InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
     return conn
 
-def init_db():
-    with get_db() as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                description TEXT NOT NULL,
-                amount REAL NOT NULL,
-                date TEXT NOT NULL,
-                label TEXT,  -- Category/label for the transaction
-                is_recurring BOOLEAN DEFAULT FALSE,
-                recurring_id INTEGER,
-                is_confirmed BOOLEAN DEFAULT FALSE,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS recurring_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                description TEXT NOT NULL,
-                amount REAL NOT NULL,
-                start_date TEXT NOT NULL,
-                label TEXT,  -- Category/label for the recurring transaction
-                frequency TEXT NOT NULL,  -- 'daily', 'weekly', 'monthly'
-                interval INTEGER DEFAULT 1,
-                end_date TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                current_balance REAL DEFAULT 0,
-                payday_frequency TEXT DEFAULT 'monthly',
-                payday_date TEXT
-            )
-        ''')
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key TEXT UNIQUE NOT NULL,
-                value TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Insert default user settings if not exists
-        conn.execute('INSERT OR IGNORE INTO user_settings (id) VALUES (1)')
-
-        # Create users table if not exists (single-user setup)
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                show_advanced BOOLEAN DEFAULT FALSE,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        # Insert default user if not exists
-        conn.execute('INSERT OR IGNORE INTO users (id) VALUES (1)')
-
-        # Migration: Add show_advanced column if it doesn't exist
-        cursor = conn.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'show_advanced' not in columns:
-            conn.execute('ALTER TABLE users ADD COLUMN show_advanced BOOLEAN DEFAULT FALSE')
-
-        # Create indexes for performance
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_is_confirmed ON transactions(is_confirmed)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_recurring_id ON transactions(recurring_id)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date_confirmed ON transactions(date, is_confirmed)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_transactions_start_date ON recurring_transactions(start_date)')
-        conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_transactions_frequency ON recurring_transactions(frequency)')
+def connect(tenant=None):
+    """Open a new, uncached connection to a tenant's database; the caller closes it"""
+    return _open(_require(tenant))
+
+def get_db(tenant=None):
+    """Connection to a tenant's database (default: the current tenant).
+
+    Connections are cached per thread in a bounded LRU and shared by every
+    caller on that thread, so don't close them; use connect() for a private
+    connection. A shard is migrated on first use; unprovisioned tenants raise
+    UnknownTenant.
+    """
+    path = database_path(tenant)
+    cache = getattr(_local, 'connections', None)
+    if cache is None:
+        cache = _local.connections = OrderedDict()
+    conn = cache.get(path)
+    if conn is not None:
+        cache.move_to_end(path)
+        return conn
+    conn = _open(_require(tenant))
+    if path not in _migrated:
+        migrate(conn)
+        _migrated.add(path)
+    cache[path] = conn
+    while len(cache) > MAX_OPEN_CONNECTIONS:
+        _, evicted = cache.popitem(last=False)
+        evicted.close()
+    return conn
+
+def close_connections():
+    """Close the connections cached by the calling thread"""
+    cache = getattr(_local, 'connections', None)
+    while cache:
+        _, conn = cache.popitem()
+        conn.close()
+
+def tenants():
+    """Ids of the tenants that have a database, the default tenant first"""
+    names = sorted(name[:-3] for name in os.listdir(TENANT_DIR) if name.endswith('.db')) if os.path.isdir(TENANT_DIR) else []
+    return [DEFAULT_TENANT] + [name for name in names if valid_tenant(name) and name != DEFAULT_TENANT]
+
+# Columns of transactions, in table order (day was added by a migration).
+# transactions_archive and the all_transactions view use the same columns.
+TRANSACTION_COLUMNS = ['id', 'description', 'amount', 'date', 'label', 'is_recurring', 'recurring_id',
+                       'is_confirmed', 'created_at', 'day']
+
+# Tables whose writes bump data_version
+VERSIONED_TABLES = ['transactions', 'recurring_transactions', 'user_settings', 'settings', 'users']
+
+def get_data_version(conn=None):
+    """Return the current data version (changes after every write to a versioned table)"""
+    if conn is None:
+        conn = get_db()
+    row = conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+# Default values for the settings table, inserted by migration and used by
+# the restore-default endpoint
+DEFAULT_SETTINGS = {
+    'recurring_sensitivity': 0.8,
+    'auto_confirm_sensitivity': 0.7,
+    'custom_recurring_algorithm': {
+        "min_occurrences": 2,
+        "interval_tolerance": 0.3,
+        "amount_tolerance": 0.1,
+        "frequency_detection": {
+            "daily": 1,
+            "weekly": 7,
+            "monthly": 30
+        }
+    },
+    'custom_auto_confirm_algorithm': {
+        "similarity_threshold": 0.7,
+        "amount_tolerance": 0.05,
+        "date_diff_max": 3,
+        "high_confidence": {
+            "similarity": 0.9,
+            "amount": 0.01
+        }
+    },
+    'date_format': 'DD-MMMM-YYYY',
+    'forecast_period': 12
+}
+
+def encode_setting(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+# Schema migrations. Each step runs once, in order, and PRAGMA user_version
+# records how many have been applied. Steps must stay idempotent because
+# databases created before versioning start at user_version 0 with some or
+# all of the schema already present. Never edit a released step; append a
+# new one instead.
+
+def _migration_initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL,
+            label TEXT,  -- Category/label for the transaction
+            is_recurring BOOLEAN DEFAULT FALSE,
+            recurring_id INTEGER,
+            is_confirmed BOOLEAN DEFAULT FALSE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            start_date TEXT NOT NULL,
+            label TEXT,  -- Category/label for the recurring transaction
+            frequency TEXT NOT NULL,  -- 'daily', 'weekly', 'monthly'
+            interval INTEGER DEFAULT 1,
+            end_date TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            current_balance REAL DEFAULT 0,
+            payday_frequency TEXT DEFAULT 'monthly',
+            payday_date TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT UNIQUE NOT NULL,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Insert default user settings if not exists
+    conn.execute('INSERT OR IGNORE INTO user_settings (id) VALUES (1)')
+
+    # Create users table if not exists (single-user setup)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            show_advanced BOOLEAN DEFAULT FALSE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Insert default user if not exists
+    conn.execute('INSERT OR IGNORE INTO users (id) VALUES (1)')
+
+    # Add show_advanced column to users tables created before it existed
+    if 'show_advanced' not in _columns(conn, 'users'):
+        conn.execute('ALTER TABLE users ADD COLUMN show_advanced BOOLEAN DEFAULT FALSE')
+
+    # Create indexes for performance
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_is_confirmed ON transactions(is_confirmed)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_recurring_id ON transactions(recurring_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_date_confirmed ON transactions(date, is_confirmed)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_transactions_start_date ON recurring_transactions(start_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_transactions_frequency ON recurring_transactions(frequency)')
+
+def _migration_default_settings(conn):
+    for key, value in DEFAULT_SETTINGS.items():
+        conn.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (key, encode_setting(value)))
+
+def _migration_day_column(conn):
+    # Integer day column on transactions, backfilled from date
+    if 'day' not in _columns(conn, 'transactions'):
+        conn.execute('ALTER TABLE transactions ADD COLUMN day INTEGER')
+        conn.execute(
+            'UPDATE transactions SET day = CAST(julianday(substr(date, 1, 10)) - ? AS INTEGER)',
+            (_EPOCH_JULIANDAY,)
+        )
+    # Covering indexes for integer day range queries
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_day ON transactions(day)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_confirmed_day_amount ON transactions(is_confirmed, day, amount)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_recurring_day ON transactions(recurring_id, day)')
+
+def _migration_data_version(conn):
+    # Data version: bumped by triggers on every write so readers can
+    # answer conditional GETs without re-running their queries
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)')
+    for table in VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+def _migration_change_log(conn):
+    # Change log: one row per insert/update/delete on a versioned table,
+    # read by /api/changes so clients can apply deltas instead of refetching
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,  -- 'insert', 'update', 'delete'
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        for event, ref in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_changes
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{event.lower()}');
+                END
+            ''')
+
+def _migration_transactions_archive(conn):
+    # Cold storage for old confirmed transactions (see archive.py). Rows keep
+    # their ids; AUTOINCREMENT on transactions means ids are never reused.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions_archive (
+            id INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL,
+            label TEXT,
+            is_recurring BOOLEAN DEFAULT FALSE,
+            recurring_id INTEGER,
+            is_confirmed BOOLEAN DEFAULT FALSE,
+            created_at TEXT,
+            day INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_archive_day ON transactions_archive(day)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_archive_recurring_day ON transactions_archive(recurring_id, day)')
+    columns = ', '.join(TRANSACTION_COLUMNS)
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS all_transactions AS
+        SELECT {columns} FROM transactions
+        UNION ALL
+        SELECT {columns} FROM transactions_archive
+    ''')
+    # Moving a row into the archive deletes it from transactions. Clients
+    # shouldn't apply that as a delete, so only log deletes of unarchived rows
+    conn.execute('DROP TRIGGER IF EXISTS trg_transactions_delete_changes')
+    conn.execute('''
+        CREATE TRIGGER trg_transactions_delete_changes
+        AFTER DELETE ON transactions
+        WHEN NOT EXISTS (SELECT 1 FROM transactions_archive WHERE id = OLD.id)
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op) VALUES ('transactions', OLD.id, 'delete');
+        END
+    ''')
+    # Deleting an archived row (with its recurring rule) is a real delete
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_archive_delete_version
+        AFTER DELETE ON transactions_archive
+        BEGIN
+            UPDATE data_version SET version = version + 1 WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_archive_delete_changes
+        AFTER DELETE ON transactions_archive
+        BEGIN
+            INSERT INTO change_log (table_name, row_id, op) VALUES ('transactions', OLD.id, 'delete');
+        END
+    ''')
+
+def _migration_query_indexes(conn):
+    # Index set checked by benchmarks/query_plans.py against every query the
+    # API runs. Drop indexes no query uses (date columns are no longer
+    # filtered on, is_confirmed alone is two values, frequency is never
+    # filtered) or that a wider index makes redundant.
+    for index in ('idx_transactions_date', 'idx_transactions_is_confirmed', 'idx_transactions_date_confirmed',
+                  'idx_transactions_recurring_id', 'idx_transactions_confirmed_day_amount',
+                  'idx_recurring_transactions_start_date', 'idx_recurring_transactions_frequency'):
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+    # Confirmed/unconfirmed windows in (day, id) order: filtered reads and
+    # exports, fuzzy auto-confirm candidates, archive batches
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_confirmed_day ON transactions(is_confirmed, day)')
+    # Auto-confirm's exact match; partial, so it only holds unconfirmed rows
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_unconfirmed_match
+        ON transactions(day, amount, description) WHERE is_confirmed = FALSE
+    ''')
+
+def _migration_normalise_legacy_dates(conn):
+    # The day backfill only reads ISO dates, so rows stored in another format
+    # were left with a NULL day and dropped by every day filter. Rewrite them
+    # (and ISO dates with a time after them) as plain ISO dates with their
+    # day; a date that can't be read stops the migration.
+    unreadable = []
+    for table in ('transactions', 'transactions_archive'):
+        for id, stored in conn.execute(f'SELECT id, date FROM {table} WHERE day IS NULL OR length(date) != 10').fetchall():
+            try:
+                value = parse_legacy_date(stored)
+            except (AttributeError, TypeError, ValueError):
+                unreadable.append(id)
+                continue
+            conn.execute(f'UPDATE {table} SET date = ?, day = ? WHERE id = ?',
+                         (value.isoformat(), to_day(value), id))
+    if unreadable:
+        raise ValueError(f'{len(unreadable)} transaction(s) have dates in no supported format '
+                         f'(ids {", ".join(map(str, unreadable[:20]))}); fix them and restart')
+
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_default_settings,
+    _migration_day_column,
+    _migration_data_version,
+    _migration_change_log,
+    _migration_transactions_archive,
+    _migration_query_indexes,
+    _migration_normalise_legacy_dates,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def _columns(conn, table):
+    return [column[1] for column in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def migrate(conn):
+    """Apply pending migrations; returns the schema version.
+
+    A database that is already current costs a single PRAGMA read.
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    # WAL lets long reads (exports, backups) run without blocking writers.
+    # journal_mode can't change inside a transaction and persists in the file.
+    conn.execute('PRAGMA journal_mode=WAL')
+    # Take the write lock up front and re-read the version, so concurrently
+    # booting workers apply each migration exactly once
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[number - 1](conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return max(version, SCHEMA_VERSION)
+
+def init_db(tenant=None):
+    """Create or upgrade a tenant's database (default: the current tenant)"""
+    conn = connect(tenant)
+    try:
+        version = migrate(conn)
+    finally:
+        conn.close()
+    _migrated.add(database_path(tenant))
+    return version
+
+def create_tenant(tenant):
+    """Provision a tenant's database, or upgrade it if it exists; returns its schema version"""
+    path = database_path(tenant)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = _open(path)
+    try:
+        version = migrate(conn)
+    finally:
+        conn.close()
+    _migrated.add(path)
+    return version
 
 if __name__ == '__main__':
-    init_db()
+    parser = argparse.ArgumentParser(description='Create or upgrade the tenant databases')
+    parser.add_argument('--create-tenant', action='append', default=[], metavar='ID', help='provision a new tenant')
+    args = parser.parse_args()
+    for tenant in args.create_tenant + CONFIGURED_TENANTS:
+        create_tenant(tenant)
+    for tenant in tenants():
+        init_db(tenant)
     print("Database initialized.")
@@ -0,0 +1,97 @@
+"""Conditional GETs and response compression.
+
+Read endpoints decorated with @conditional get a weak ETag derived from the
+database data version (see database.get_data_version). A request whose
+If-None-Match matches is answered with 304 before the view runs, so the
+frontend's refetch after every mutation costs one single-row SELECT when
+nothing changed.
+
+init_app registers an after_request hook that gzip- or brotli-compresses
+large JSON/text responses when the client accepts it. brotli is optional:
+install the `brotli` package to enable it, otherwise gzip is used.
+"""
+import gzip
+import hashlib
+from datetime import date
+from functools import wraps
+
+from flask import request, make_response
+
+from database import get_data_version, current_tenant
+from tenancy import TENANT_HEADER
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Responses smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = ('application/json', 'text/plain', 'text/csv', 'application/x-ndjson')
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def make_etag(version):
+    """ETag for the current request at a data version.
+
+    Includes the tenant (each has its own data version), the full path
+    (query string) and today's date, since default transaction windows are
+    relative to the current day.
+    """
+    key = f'{current_tenant()}:{version}:{request.full_path}:{date.today().isoformat()}'
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def conditional(view):
+    """Answer If-None-Match with 304 when the data version hasn't changed"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = make_etag(get_data_version())
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag, weak=True)
+        response.vary.add(TENANT_HEADER)
+        # Allow caching but make the browser revalidate every time
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return wrapper
+
+
+def _accepted_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = _accepted_encoding()
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    """Register response compression on a Flask app"""
+    app.after_request(compress_response)
@@ -0,0 +1,286 @@
+"""Per-request instrumentation: SQL query counting/timing and endpoint latency.
+
+Enable with BILLPREPARED_METRICS=1. When enabled, connections handed out by
+database.get_db count every statement, the rows it returns and the time spent
+in SQLite, and each request records its latency into a per-endpoint histogram.
+Metrics are rendered in Prometheus text format for /api/metrics and each
+response carries a Server-Timing header.
+
+The slow-query log is opt-in via BILLPREPARED_SLOW_QUERY_MS=<ms>: statements
+slower than the threshold are logged together with their EXPLAIN QUERY PLAN.
+
+When disabled, get_db returns plain sqlite3 connections and the request hooks
+return immediately, so the cost is a single flag check per connection/request.
+Metrics are kept per process; with several gunicorn workers each worker
+reports its own numbers.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+logger = logging.getLogger('billprepared.sql')
+
+ENABLED = os.environ.get('BILLPREPARED_METRICS', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('BILLPREPARED_SLOW_QUERY_MS') or 0) or None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_lock = threading.Lock()
+# (endpoint, method) -> [bucket counts..., sum, count]
+_latency = {}
+# (endpoint, method, status) -> count
+_requests = {}
+# endpoint -> [queries, rows, seconds]
+_sql = {}
+
+
+def configure(enabled=None, slow_query_ms=None):
+    """Turn instrumentation on/off at runtime (tests and benchmarks)"""
+    global ENABLED, SLOW_QUERY_MS
+    if enabled is not None:
+        ENABLED = enabled
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms or None
+
+
+def reset():
+    """Drop all collected metrics"""
+    with _lock:
+        _latency.clear()
+        _requests.clear()
+        _sql.clear()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'rows', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+
+def _stats():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def capture_statements():
+    """Collect (sql, params) for every statement this thread runs (query-plan checks)"""
+    statements = _local.captured = []
+    try:
+        yield statements
+    finally:
+        _local.captured = None
+
+
+def _capture(sql, params):
+    captured = getattr(_local, 'captured', None)
+    if captured is not None:
+        captured.append((sql, params))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that attributes execution and fetch time to the current request"""
+
+    _sql = None
+    _params = ()
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._sql, self._params = sql, parameters
+        self._elapsed = time.perf_counter() - start
+        _capture(sql, parameters)
+        stats = _stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += self._elapsed
+        if self.description is None:
+            self._finish(max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._sql, self._params = sql, ()
+        self._elapsed = time.perf_counter() - start
+        _capture(sql, None)
+        stats = _stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += self._elapsed
+        self._finish(max(self.rowcount, 0))
+        return self
+
+    def _fetched(self, rows, start, done):
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        stats = _stats()
+        if stats is not None:
+            stats.seconds += elapsed
+            stats.rows += rows
+        if done:
+            self._finish(0)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(0 if row is None else 1, start, True)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), start, True)
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), start, not rows)
+        return rows
+
+    def __next__(self):
+        # Rows read by iterating the cursor (for row in cursor)
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(0, start, True)
+            raise
+        self._fetched(1, start, False)
+        return row
+
+    def _finish(self, rows):
+        stats = _stats()
+        if stats is not None and rows:
+            stats.rows += rows
+        if SLOW_QUERY_MS is not None and self._sql and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            _log_slow_query(self.connection, self._sql, self._params, self._elapsed)
+            self._sql = None
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory used by database.get_db when enabled"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN rows for a statement as plain strings"""
+    rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    return [row[3] for row in rows]
+
+
+def _log_slow_query(conn, sql, params, elapsed):
+    try:
+        plan = explain(conn, sql, params)
+    except sqlite3.Error as e:
+        plan = [f'(plan unavailable: {e})']
+    endpoint = request.endpoint if request else None
+    logger.warning(
+        'Slow query (%.1f ms, endpoint=%s): %s params=%r\n  plan: %s',
+        elapsed * 1000, endpoint, ' '.join(sql.split()), params, '\n        '.join(plan) or '(no plan)'
+    )
+
+
+def before_request():
+    if not ENABLED:
+        return
+    g.instrumentation_start = time.perf_counter()
+    _local.stats = RequestStats()
+
+
+def after_request(response):
+    if not ENABLED or 'instrumentation_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.instrumentation_start
+    stats = _stats()
+    _local.stats = None
+    endpoint = request.endpoint or 'unmatched'
+    method = request.method
+
+    with _lock:
+        histogram = _latency.get((endpoint, method))
+        if histogram is None:
+            histogram = _latency[(endpoint, method)] = [0] * (len(LATENCY_BUCKETS) + 2)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += elapsed
+        histogram[-1] += 1
+        key = (endpoint, method, response.status_code)
+        _requests[key] = _requests.get(key, 0) + 1
+        if stats is not None:
+            sql = _sql.setdefault(endpoint, [0, 0, 0.0])
+            sql[0] += stats.queries
+            sql[1] += stats.rows
+            sql[2] += stats.seconds
+
+    timing = f'app;dur={elapsed * 1000:.1f}'
+    if stats is not None:
+        timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.queries} queries, {stats.rows} rows", ' + timing
+    response.headers['Server-Timing'] = timing
+    return response
+
+
+def init_app(app):
+    """Register the request hooks on a Flask app"""
+    app.before_request(before_request)
+    app.after_request(after_request)
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def render_prometheus():
+    """Render collected metrics in the Prometheus text exposition format"""
+    lines = [
+        '# HELP billprepared_request_duration_seconds Request latency by endpoint.',
+        '# TYPE billprepared_request_duration_seconds histogram',
+    ]
+    with _lock:
+        latency = {k: list(v) for k, v in _latency.items()}
+        requests_total = dict(_requests)
+        sql = {k: list(v) for k, v in _sql.items()}
+
+    for (endpoint, method), histogram in sorted(latency.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'billprepared_request_duration_seconds_bucket{{{_labels(endpoint=endpoint, method=method, le=bound)}}} {cumulative}')
+        lines.append(f'billprepared_request_duration_seconds_bucket{{{_labels(endpoint=endpoint, method=method, le="+Inf")}}} {histogram[-1]}')
+        lines.append(f'billprepared_request_duration_seconds_sum{{{_labels(endpoint=endpoint, method=method)}}} {histogram[-2]}')
+        lines.append(f'billprepared_request_duration_seconds_count{{{_labels(endpoint=endpoint, method=method)}}} {histogram[-1]}')
+
+    lines += ['# HELP billprepared_requests_total Requests by endpoint and status.',
+              '# TYPE billprepared_requests_total counter']
+    for (endpoint, method, status), count in sorted(requests_total.items()):
+        lines.append(f'billprepared_requests_total{{{_labels(endpoint=endpoint, method=method, status=status)}}} {count}')
+
+    for index, (name, help_text) in enumerate((
+        ('billprepared_sql_queries_total', 'SQL statements executed by endpoint.'),
+        ('billprepared_sql_rows_total', 'Rows returned or modified by endpoint.'),
+        ('billprepared_sql_duration_seconds_total', 'Time spent in SQLite by endpoint.'),
+    )):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for endpoint, values in sorted(sql.items()):
+            lines.append(f'{name}{{{_labels(endpoint=endpoint)}}} {values[index]}')
+    return '\n'.join(lines) + '\n'
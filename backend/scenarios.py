@@ -0,0 +1,337 @@
+"""What-if forecasting over the recurring rules, without touching the database.
+
+A Baseline reads the current balance, the recurring rules and the
+unconfirmed transactions once, and precomputes how many times each rule
+occurs in every month of the horizon. A scenario is an overlay of
+hypothetical changes:
+
+    {"recurring_id": 3, "amount_pct": 5}                 rent goes up 5%
+    {"recurring_id": 3, "amount": -1250, "from": "2027-01-01"}
+    {"recurring_id": 7, "cancel": true}                  cancel a subscription
+    {"add": {"description": "Car loan", "amount": -350, "frequency": "monthly",
+             "start_date": "2027-01-01", "end_date": "2031-12-01"}}
+    {"one_off": {"amount": -4000, "date": "2027-06-15"}}
+
+Evaluating one only touches the rules it changes: their occurrence counts
+are scaled by the change in amount and added to the baseline monthly flows,
+so dozens of scenarios over a 120-month horizon take milliseconds.
+
+Projected balances are end-of-month: the current balance plus every
+unconfirmed transaction (those already due count in the current month), then
+each rule's schedule beyond its stored rows. A rule's future rows are only
+materialised for the forecast period, and may have been edited or deleted one
+at a time, so up to its last stored day a rule contributes exactly the rows
+in the database. After that day, occurrences follow its schedule the way
+generate_recurring_transactions does, starting one interval after start_date.
+A stored rule whose dates don't parse has no schedule to project: it is left
+out (its stored rows still count) and listed in the response's skipped_rules.
+"""
+import calendar
+from bisect import bisect_right
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from database import parse_date, to_day, from_day
+
+HORIZON_MONTHS = 120
+MAX_HORIZON_MONTHS = 600
+MAX_SCENARIOS = 100
+FREQUENCY_DAYS = {'daily': 1, 'weekly': 7}
+
+
+class ScenarioError(ValueError):
+    """An invalid scenario or change"""
+
+
+def _parse_day(value, field):
+    try:
+        return to_day(value)
+    except (AttributeError, TypeError, ValueError):
+        raise ScenarioError(f'{field} must be a YYYY-MM-DD date')
+
+
+def _stored_rule(rule):
+    """A stored rule with its dates normalised to YYYY-MM-DD, or None if one
+    doesn't parse (rules added before dates were validated)"""
+    try:
+        start_date = parse_date(rule['start_date'][:10]).isoformat()
+        end_date = parse_date(rule['end_date'][:10]).isoformat() if rule['end_date'] else None
+    except (TypeError, ValueError):
+        return None
+    return dict(rule, start_date=start_date, end_date=end_date)
+
+
+def _monthly_days(start, interval, last_day):
+    """Epoch days of a monthly schedule after start, up to last_day.
+
+    Steps like repeatedly adding relativedelta(months=interval), the way
+    generate_recurring_transactions does: a clamped day of month stays
+    clamped (Jan 31 -> Feb 28 -> Mar 28).
+    """
+    days = []
+    year, month, dom = start.year, start.month, start.day
+    while True:
+        month += interval
+        year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+        dom = min(dom, calendar.monthrange(year, month)[1])
+        day = to_day(date(year, month, dom))
+        if day > last_day:
+            return days
+        days.append(day)
+
+
+def _amount(value, field):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ScenarioError(f'{field} must be a number')
+    return float(value)
+
+
+class Baseline:
+    """Current rules, balance and pending transactions, bucketed by month"""
+
+    def __init__(self, balance, rules, pending, stored=None, today=None, horizon=HORIZON_MONTHS, skipped=()):
+        """rules: dicts with id/amount/start_date/frequency/interval/end_date;
+        pending: (day, amount) pairs of unconfirmed transactions not tied to a
+        rule's future (one-offs, single edits, anything already due);
+        stored: {rule_id: (last stored day, [(day, amount), ...])} with a
+        rule's unconfirmed rows from today on; skipped: stored rules left out
+        of the projection because their dates don't parse"""
+        self.today = to_day(today or date.today())
+        first = date.fromisoformat(from_day(self.today)).replace(day=1)
+        # starts[m] is the first day of month m; starts[horizon] ends the horizon
+        self.months = [first + relativedelta(months=m) for m in range(horizon + 1)]
+        self.starts = [to_day(month) for month in self.months]
+        self.horizon = horizon
+        self.balance = balance
+        self.rules = {rule['id']: rule for rule in rules}
+        self.skipped = list(skipped)
+        # Monthly schedules by (start_date, interval), shared by every scenario
+        self._monthly = {}
+
+        self.flow = [0.0] * horizon
+        # Per rule: first day its schedule is projected, and its stored rows
+        # as (day, amount, month)
+        self.projected_from = {}
+        self.stored = {}
+        for rule_id, (through, rows) in (stored or {}).items():
+            if rule_id not in self.rules:
+                pending = list(pending) + list(rows)  # Rows of a rule that no longer exists
+                continue
+            self.projected_from[rule_id] = max(self.today, through + 1)
+            self.stored[rule_id] = [(day, amount, self.month_of(day)) for day, amount in sorted(rows)]
+            for day, amount, m in self.stored[rule_id]:
+                if m < horizon:
+                    self.flow[m] += amount
+
+        self.counts = {rule_id: self.occurrences(rule, self.projected_from.get(rule_id))
+                       for rule_id, rule in self.rules.items()}
+        for rule_id, counts in self.counts.items():
+            amount = self.rules[rule_id]['amount']
+            for m, count in enumerate(counts):
+                if count:
+                    self.flow[m] += amount * count
+        for day, amount in pending:
+            m = self.month_of(day)
+            if m < horizon:
+                self.flow[m] += amount
+
+    @classmethod
+    def load(cls, conn, today=None, horizon=HORIZON_MONTHS):
+        today_day = to_day(today or date.today())
+        row = conn.execute('SELECT current_balance FROM user_settings WHERE id = 1').fetchone()
+        rules, skipped = [], []
+        for stored_rule in conn.execute('''
+            SELECT id, description, amount, start_date, frequency, interval, end_date
+            FROM recurring_transactions
+        ''').fetchall():
+            rule = _stored_rule(dict(stored_rule))
+            if rule is None:
+                # Its stored rows still count, as one-offs (see __init__)
+                skipped.append({'id': stored_rule['id'], 'description': stored_rule['description']})
+            else:
+                rules.append(rule)
+        pending = conn.execute('''
+            SELECT day, amount FROM transactions
+            WHERE is_confirmed = FALSE AND (recurring_id IS NULL OR day < ?)
+        ''', (today_day,)).fetchall()
+        # Each rule's future rows; confirmed ones only mark how far it is stored
+        stored = {}
+        for recurring_id, day, amount, is_confirmed in conn.execute('''
+            SELECT recurring_id, day, amount, is_confirmed FROM transactions
+            WHERE recurring_id IS NOT NULL AND day >= ?
+        ''', (today_day,)):
+            through, rows = stored.setdefault(recurring_id, [day, []])
+            stored[recurring_id][0] = max(through, day)
+            if not is_confirmed:
+                rows.append((day, amount))
+        stored = {rule_id: (through, rows) for rule_id, (through, rows) in stored.items()}
+        return cls(row['current_balance'] if row else 0, rules, pending, stored, today, horizon, skipped)
+
+    def month_of(self, day):
+        """Horizon month index of an epoch day (days before today count as month 0)"""
+        return max(0, bisect_right(self.starts, day) - 1)
+
+    def occurrences(self, rule, lo=None, hi=None):
+        """Occurrences of a rule per month, counting only days in [lo, hi]"""
+        counts = [0] * self.horizon
+        lo = max(self.today, lo if lo is not None else self.today)
+        hi = self.starts[-1] - 1 if hi is None else min(hi, self.starts[-1] - 1)
+        if rule.get('end_date'):
+            hi = min(hi, to_day(rule['end_date']))
+        if lo > hi:
+            return counts
+        start = date.fromisoformat(rule['start_date'])
+        interval = rule.get('interval') or 1
+        frequency = rule['frequency']
+
+        if frequency in FREQUENCY_DAYS:
+            step = FREQUENCY_DAYS[frequency] * interval
+            first = to_day(start)
+            # Occurrence k (k >= 1) falls on first + k * step
+            for m in range(self.month_of(lo), self.month_of(hi) + 1):
+                month_lo = max(lo, self.starts[m])
+                month_hi = min(hi, self.starts[m + 1] - 1)
+                k_min = max(1, -(-(month_lo - first) // step))
+                k_max = (month_hi - first) // step
+                if k_max >= k_min:
+                    counts[m] = k_max - k_min + 1
+        elif frequency == 'monthly':
+            key = (rule['start_date'], interval)
+            if key not in self._monthly:
+                self._monthly[key] = _monthly_days(start, interval, self.starts[-1] - 1)
+            for day in self._monthly[key]:
+                if day > hi:
+                    break
+                if day >= lo:
+                    counts[self.month_of(day)] += 1
+        return counts
+
+    def _rule_delta(self, flow, rule, base_amount, timeline):
+        """Add the flow change from a rule's amount timeline, [(start_day, amount), ...] in date order"""
+        rule_id = rule.get('id')
+        stored = self.stored.get(rule_id, [])
+        projected_from = self.projected_from.get(rule_id, self.today)
+        for i, (start_day, amount) in enumerate(timeline):
+            until = timeline[i + 1][0] - 1 if i + 1 < len(timeline) else None
+            # Stored rows take the new amount in place of their own
+            for day, stored_amount, m in stored:
+                if day >= start_day and (until is None or day <= until) and m < self.horizon:
+                    flow[m] += amount - stored_amount
+            difference = amount - base_amount
+            if difference == 0:
+                continue
+            if start_day <= projected_from and until is None and rule_id in self.counts:
+                counts = self.counts[rule_id]  # Precomputed for the whole horizon
+            else:
+                counts = self.occurrences(rule, max(start_day, projected_from), until)
+            for m, count in enumerate(counts):
+                if count:
+                    flow[m] += difference * count
+
+    def evaluate(self, changes):
+        """Monthly flows for the baseline with a list of changes applied"""
+        if not isinstance(changes, list):
+            raise ScenarioError('changes must be a list')
+        flow = list(self.flow)
+        timelines = {}
+        for index, change in enumerate(changes):
+            if not isinstance(change, dict):
+                raise ScenarioError('each change must be an object')
+            if 'add' in change:
+                rule = change['add']
+                if not isinstance(rule, dict) or rule.get('frequency') not in ('daily', 'weekly', 'monthly'):
+                    raise ScenarioError('add needs a frequency of daily, weekly or monthly')
+                interval = rule.get('interval', 1)
+                if isinstance(interval, bool) or not isinstance(interval, int) or interval < 1:
+                    raise ScenarioError('add.interval must be a positive integer')
+                end_day = _parse_day(rule['end_date'], 'add.end_date') if rule.get('end_date') else None
+                # A synthetic id, so an added rule never picks up a stored
+                # rule's rows or counts through a caller-supplied one
+                rule = {
+                    'id': ('add', index),
+                    'amount': _amount(rule.get('amount'), 'add.amount'),
+                    'frequency': rule['frequency'],
+                    'interval': interval,
+                    'start_date': from_day(_parse_day(rule.get('start_date'), 'add.start_date')),
+                    'end_date': from_day(end_day) if end_day is not None else None,
+                }
+                self._rule_delta(flow, rule, 0.0, [(self.today, rule['amount'])])
+            elif 'one_off' in change:
+                one_off = change['one_off']
+                if not isinstance(one_off, dict):
+                    raise ScenarioError('one_off must be an object')
+                m = self.month_of(_parse_day(one_off.get('date'), 'one_off.date'))
+                if m < self.horizon:
+                    flow[m] += _amount(one_off.get('amount'), 'one_off.amount')
+            elif 'recurring_id' in change:
+                recurring_id = change['recurring_id']
+                if isinstance(recurring_id, bool) or not isinstance(recurring_id, int):
+                    raise ScenarioError('recurring_id must be an integer')
+                rule = self.rules.get(recurring_id)
+                if rule is None:
+                    raise ScenarioError(f'Unknown recurring_id: {recurring_id}')
+                start_day = _parse_day(change['from'], 'from') if change.get('from') else self.today
+                timeline = timelines.setdefault(rule['id'], [])
+                if change.get('cancel'):
+                    timeline.append((start_day, None, 0.0))
+                elif 'amount' in change:
+                    timeline.append((start_day, None, _amount(change['amount'], 'amount')))
+                elif 'amount_pct' in change:
+                    timeline.append((start_day, _amount(change['amount_pct'], 'amount_pct'), None))
+                else:
+                    raise ScenarioError('a recurring change needs cancel, amount or amount_pct')
+            else:
+                raise ScenarioError('each change needs recurring_id, add or one_off')
+
+        for rule_id, timeline in timelines.items():
+            rule = self.rules[rule_id]
+            # Percentages apply to the amount in force at their date
+            amount = rule['amount']
+            resolved = []
+            for start_day, pct, value in sorted(timeline, key=lambda change: change[0]):
+                amount = value if pct is None else amount * (1 + pct / 100)
+                resolved.append((start_day, amount))
+            self._rule_delta(flow, rule, rule['amount'], resolved)
+        return flow
+
+    def summarize(self, flow):
+        balances = []
+        balance = self.balance
+        for amount in flow:
+            balance += amount
+            balances.append(round(balance, 2))
+        lowest = min(range(len(balances)), key=balances.__getitem__) if balances else None
+        first_negative = next((m for m, value in enumerate(balances) if value < 0), None)
+        return {
+            'balances': balances,
+            'flows': [round(amount, 2) for amount in flow],
+            'end_balance': balances[-1] if balances else round(self.balance, 2),
+            'lowest_balance': balances[lowest] if balances else None,
+            'lowest_month': self.label(lowest),
+            'first_negative_month': self.label(first_negative),
+        }
+
+    def label(self, m):
+        return None if m is None else self.months[m].strftime('%Y-%m')
+
+
+def run_scenarios(baseline, scenarios):
+    """Evaluate a batch of scenarios against one baseline"""
+    if not isinstance(scenarios, list) or len(scenarios) > MAX_SCENARIOS:
+        raise ScenarioError(f'scenarios must be a list of at most {MAX_SCENARIOS}')
+    base = baseline.summarize(baseline.flow)
+    results = []
+    for i, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ScenarioError('each scenario must be an object')
+        result = baseline.summarize(baseline.evaluate(scenario.get('changes', [])))
+        result['name'] = scenario.get('name') or f'Scenario {i + 1}'
+        result['difference'] = round(result['end_balance'] - base['end_balance'], 2)
+        results.append(result)
+    return {
+        'months': [baseline.label(m) for m in range(baseline.horizon)],
+        'baseline': base,
+        'scenarios': results,
+        'skipped_rules': baseline.skipped,
+    }
@@ -0,0 +1,39 @@
+"""Per-request tenant selection.
+
+Each request names its tenant in the X-Tenant-ID header, or the `tenant`
+query parameter for clients that can't set headers (EventSource, download
+links). Requests without one use the default tenant, whose data lives in the
+original budget.db. Tenant ids are lowercase letters, digits, '-' and '_'.
+Only provisioned tenants are served (see database.create_tenant); others get
+a 404, so requests can't create databases.
+
+The header only selects a ledger, it does not authenticate: any client that
+can reach the API can name any tenant. Deploy behind something that does.
+"""
+from flask import jsonify, request
+
+import database
+
+TENANT_HEADER = 'X-Tenant-ID'
+TENANT_PARAM = 'tenant'
+
+
+def requested_tenant():
+    tenant = request.headers.get(TENANT_HEADER) or request.args.get(TENANT_PARAM)
+    return tenant.strip().lower() if tenant else database.DEFAULT_TENANT
+
+
+def before_request():
+    tenant = requested_tenant()
+    if not database.valid_tenant(tenant):
+        return jsonify({'error': f'Invalid tenant id: {tenant}'}), 400
+    if not database.tenant_exists(tenant):
+        return jsonify({'error': f'Unknown tenant: {tenant}'}), 404
+    # Not reset on teardown: streamed responses (export, change stream) run
+    # after teardown, and every request sets its own tenant here anyway
+    database.set_tenant(tenant)
+
+
+def init_app(app):
+    """Register tenant selection on a Flask app"""
+    app.before_request(before_request)
@@ -0,0 +1,126 @@
+"""Hot-table query latency vs history length, before and after archiving.
+
+For each history length a database is generated, then the everyday endpoints
+are timed against it as-is and again after archive.compact() has moved old
+confirmed rows into transactions_archive. After archiving, the hot table size
+(and so these latencies) should no longer depend on the length of history.
+
+Also reports archiving throughput and the mean time per batch, which is about
+how long a concurrent writer can be kept waiting. Before timing, it checks that
+an archived row listed by GET /api/transactions is refused with 409 by the
+edit, delete and confirm endpoints (and left unchanged); exits 1 if not.
+
+Usage: python benchmarks/bench_archive.py [--years 1,5,15] [--repeat 7]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def measure(client, statement, repeat):
+    def window():
+        assert client.get('/api/transactions').status_code == 200
+
+    def confirm():
+        response = client.post('/api/import/csv/confirm', data={'file': (io.BytesIO(statement), 'statement.csv')})
+        assert response.status_code == 200, response.status_code
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        return timed(window, repeat), timed(confirm, repeat)
+
+
+def check_read_only(client, conn):
+    """Edit, delete and confirm an archived row the API lists; returns the unexpected responses"""
+    archived = conn.execute('SELECT * FROM transactions_archive ORDER BY id LIMIT 1').fetchone()
+    if archived is None:
+        return []
+    listed = client.get(f"/api/transactions?start_date={archived['date']}&end_date={archived['date']}").json
+    failures = [] if any(tx['id'] == archived['id'] for tx in listed) else ['archived row not listed']
+    url = f"/api/transactions/{archived['id']}"
+    for method, path, body in (('put', url, {'amount': 1, 'edit_type': 'single'}), ('delete', url, None),
+                               ('put', url + '/confirm', None)):
+        response = getattr(client, method)(path, json=body)
+        if response.status_code != 409:
+            failures.append(f'{method.upper()} {path}: {response.status_code}')
+    if tuple(conn.execute('SELECT * FROM transactions_archive WHERE id = ?', (archived['id'],)).fetchone()) != tuple(archived):
+        failures.append('archived row changed')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', default='1,5,15')
+    parser.add_argument('--rules', type=int, default=60)
+    parser.add_argument('--older-than-days', type=int, default=365)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='billprepared-archive-')
+    try:
+        import database
+        database.DATABASE = os.path.join(workdir, 'budget.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.init_db()
+            import app as app_module
+            import archive
+        client = app_module.app.test_client()
+
+        print(f'{"years":>5} {"rows":>8} {"hot":>7}   {"window before/after (ms)":>26}   '
+              f'{"auto-confirm before/after (ms)":>32}   archive')
+        for years in [int(y) for y in args.years.split(',')]:
+            rules = generator.generate_rules(args.rules, years, seed=args.seed)
+            database.close_connections()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(database.DATABASE + suffix):
+                    os.remove(database.DATABASE + suffix)
+            with contextlib.redirect_stdout(io.StringIO()):
+                rows = generator.generate_database(database.DATABASE, rules, years, seed=args.seed)
+            # Statement confirming last month's activity, as in run.py
+            statement = generator.statement_for_confirm(rules, seed=args.seed)
+
+            window_before, confirm_before = measure(client, statement, args.repeat)
+
+            conn = database.connect()
+            start = time.perf_counter()
+            stats = archive.compact(conn, args.older_than_days, args.batch_size)
+            elapsed = time.perf_counter() - start
+            failures = check_read_only(client, conn)
+            conn.close()
+            if failures:
+                print(f'archived rows are not read-only: {failures}')
+                sys.exit(1)
+
+            window_after, confirm_after = measure(client, statement, args.repeat)
+            batches = stats['moved'] // args.batch_size + 1
+            print(f'{years:5d} {rows:8d} {stats["hot_rows"]:7d}   '
+                  f'{window_before * 1000:12.2f} / {window_after * 1000:8.2f}    '
+                  f'{confirm_before * 1000:15.2f} / {confirm_after * 1000:10.2f}     '
+                  f'{stats["moved"] / elapsed:8.0f} rows/s, {elapsed / batches * 1000:.1f} ms/batch')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Snapshot backup duration, and its effect on foreground request latency.
+
+Generates a database and archives its old history, as a long-running install
+would have. Then, for each backup setting, it times --repeat backups
+while a foreground thread keeps calling the API (four reads of the
+transaction window to one insert). Foreground latency is compared against
+the same load with no backup running. The one-step backup (pages=-1) copies
+the whole file in a single call. The paged settings copy BACKUP_PAGES-sized
+steps and pause in between. A plain file copy is timed for reference: it is
+what backing up looked like before, and it is not safe against concurrent
+writes.
+
+Usage: python benchmarks/bench_backup.py [--years 15] [--rules 300] [--repeat 5]
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+# (label, pages per step, pause between steps)
+SETTINGS = [
+    ('one step', -1, 0),
+    ('1024 pages', 1024, 0.005),
+    ('256 pages', 256, 0.005),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Foreground:
+    """Thread calling the API until stopped, recording request latencies"""
+
+    def __init__(self, app):
+        self.app = app
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+
+    def _run(self):
+        client = self.app.test_client()
+        n = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                if n % 5 == 4:
+                    response = client.post('/api/transactions', json={
+                        'description': 'BENCH', 'amount': -1, 'date': '2026-01-01'})
+                else:
+                    response = client.get('/api/transactions')
+                assert response.status_code < 300, response.status_code
+                self.samples.append(time.perf_counter() - start)
+                n += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        ms = [sample * 1000 for sample in self.samples]
+        return f'{statistics.median(ms):7.2f} {percentile(ms, 95):7.2f} {max(ms):8.2f}  ({len(ms)} requests)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=15)
+    parser.add_argument('--rules', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--idle-seconds', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='billprepared-backup-')
+    try:
+        import database
+        database.DATABASE = os.path.join(workdir, 'budget.db')
+        rules = generator.generate_rules(args.rules, args.years, seed=args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = generator.generate_database(database.DATABASE, rules, args.years, seed=args.seed)
+            import app as app_module
+            import archive
+            import backup
+        conn = database.connect()
+        archive.compact(conn)
+        conn.close()
+        backup.BACKUP_DIR = os.path.join(workdir, 'backups')
+        size = os.path.getsize(database.DATABASE)
+        print(f'{rows} transactions, {size / 1e6:.1f} MB database')
+        print(f'{"":12} {"backup s":>9} {"copy s":>7} {"gz MB":>7}   foreground ms: {"p50":>7} {"p95":>7} {"max":>8}')
+
+        with Foreground(app_module.app) as idle:
+            time.sleep(args.idle_seconds)
+        print(f'{"no backup":12} {"":>9} {"":>7} {"":>7}                  {idle.summary()}')
+
+        with Foreground(app_module.app) as load:
+            start = time.perf_counter()
+            shutil.copyfile(database.DATABASE, os.path.join(workdir, 'copy.db'))
+            elapsed = time.perf_counter() - start
+        print(f'{"file copy":12} {elapsed:9.3f} {elapsed:7.3f} {"":>7}                  {load.summary()}')
+
+        for label, pages, pause in SETTINGS:
+            with Foreground(app_module.app) as load:
+                results = [backup.backup('default', keep=1, pages=pages, pause=pause) for _ in range(args.repeat)]
+            seconds = statistics.median(result['seconds'] for result in results)
+            copy_seconds = statistics.median(result['copy_seconds'] for result in results)
+            print(f'{label:12} {seconds:9.3f} {copy_seconds:7.3f} '
+                  f'{results[-1]["size"] / 1e6:7.2f}                  {load.summary()}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""CSV import throughput: compiled per-file parser vs the original DD/MM/YYYY loop.
+
+Generates a statement in each validated date format and reports rows/sec for
+csv_import.parse_csv next to the hard-coded split('/') parser the import
+endpoints used before layout detection existed.
+
+Usage: python benchmarks/bench_csv_parse.py [--rows 100000]
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from csv_import import parse_csv  # noqa: E402
+from database import VALIDATED_FORMATS  # noqa: E402
+
+STRFTIME = {
+    'MM/DD/YYYY': '%m/%d/%Y',
+    'DD/MM/YYYY': '%d/%m/%Y',
+    'YYYY-MM-DD': '%Y-%m-%d',
+    'DD-MM-YYYY': '%d-%m-%Y',
+    'MMM DD, YYYY': '%b %d, %Y',
+    'DD-MMMM-YYYY': '%d-%B-%Y',
+    'DD-MMM-YY': '%d-%b-%y',
+}
+
+
+def legacy_parse(text):
+    """The parser both import endpoints used before csv_import"""
+    csv_data = []
+    reader = csv.reader(io.StringIO(text, newline=None))
+    for row in reader:
+        if len(row) >= 3:
+            date_str, amount_str, description = row[0], row[1], row[2]
+            try:
+                date_parts = date_str.split('/')
+                if len(date_parts) == 3:
+                    d = f"{date_parts[2]}-{date_parts[1].zfill(2)}-{date_parts[0].zfill(2)}"
+                else:
+                    continue
+                amount = float(amount_str.strip('"'))
+                csv_data.append({'date': d, 'amount': amount, 'description': description.strip()})
+            except ValueError:
+                continue
+    return csv_data
+
+
+def make_statement(rows, fmt, seed=1):
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for i in range(rows):
+        d = start + timedelta(days=rng.randrange(1500))
+        writer.writerow([d.strftime(STRFTIME[fmt]), f'{rng.uniform(-500, 500):.2f}', f'CARD PURCHASE {i % 211} REF{i}'])
+    return out.getvalue()
+
+
+def rows_per_sec(fn, text, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        parsed = fn(text)
+        best = min(best, time.perf_counter() - t0)
+    assert len(parsed) == rows, (len(parsed), rows)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    baseline = rows_per_sec(legacy_parse, make_statement(args.rows, 'DD/MM/YYYY'), args.rows, args.repeat)
+    print(f'{"legacy DD/MM/YYYY":18s} {baseline:12,.0f} rows/s')
+    for fmt in VALIDATED_FORMATS:
+        rate = rows_per_sec(parse_csv, make_statement(args.rows, fmt), args.rows, args.repeat)
+        print(f'{fmt:18s} {rate:12,.0f} rows/s   {rate / baseline:5.2f}x legacy')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Compare ISO string dates against the integer day column.
+
+Builds a throwaway database, fills it with transactions and times the two
+hot paths that used to parse dates in Python:
+
+* window queries (``get_transactions``): ``date BETWEEN`` on the TEXT column
+  versus ``day BETWEEN`` on the integer column
+* fuzzy match candidate selection (``auto_confirm_transactions``): scanning
+  every unconfirmed row and parsing both dates per pair versus an indexed
+  ``day BETWEEN`` window
+
+Usage: python benchmarks/bench_date_column.py [--rows 50000] [--csv-rows 50]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import database  # noqa: E402
+from database import to_day  # noqa: E402
+
+
+def build_db(path, rows, seed=1):
+    database.DATABASE = path
+    database.init_db()
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365 * 5)
+    conn = sqlite3.connect(path)
+    batch = []
+    for i in range(rows):
+        d = start + timedelta(days=rng.randrange(365 * 6))
+        iso = d.isoformat()
+        batch.append((f'Merchant {i % 97}', round(rng.uniform(-500, 500), 2), iso, to_day(iso),
+                      d < date.today()))
+    conn.executemany(
+        'INSERT INTO transactions (description, amount, date, day, is_confirmed) VALUES (?, ?, ?, ?, ?)',
+        batch
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    return conn
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--csv-rows', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = build_db(os.path.join(tmp, 'bench.db'), args.rows)
+        today = date.today()
+        start_iso = (today - timedelta(days=30)).isoformat()
+        end_iso = (today + timedelta(days=365)).isoformat()
+
+        def window_string():
+            conn.execute('SELECT * FROM transactions WHERE date >= ? AND date <= ? ORDER BY date ASC',
+                         (start_iso, end_iso)).fetchall()
+
+        def window_day():
+            conn.execute('SELECT * FROM transactions WHERE day BETWEEN ? AND ? ORDER BY day ASC',
+                         (to_day(start_iso), to_day(end_iso))).fetchall()
+
+        rng = random.Random(2)
+        csv_dates = [(today + timedelta(days=rng.randrange(-20, 300))).isoformat() for _ in range(args.csv_rows)]
+
+        def fuzzy_string():
+            for csv_date in csv_dates:
+                rows = conn.execute('SELECT id, date FROM transactions WHERE is_confirmed = FALSE').fetchall()
+                for row in rows:
+                    diff = abs((datetime.fromisoformat(csv_date) - datetime.fromisoformat(row[1])).days)
+                    if diff > 3:
+                        continue
+
+        def fuzzy_day():
+            for csv_date in csv_dates:
+                csv_day = to_day(csv_date)
+                rows = conn.execute('SELECT id, day FROM transactions WHERE is_confirmed = FALSE AND day BETWEEN ? AND ?',
+                                    (csv_day - 3, csv_day + 3)).fetchall()
+                for row in rows:
+                    abs(csv_day - row[1])
+
+        print(f'rows={args.rows} csv_rows={args.csv_rows} (best of {args.repeat})')
+        for name, legacy, current in (
+            ('window query', window_string, window_day),
+            ('fuzzy candidates', fuzzy_string, fuzzy_day),
+        ):
+            t_legacy = timed(legacy, args.repeat)
+            t_current = timed(current, args.repeat)
+            print(f'{name:18s} string/parse {t_legacy * 1000:9.1f} ms   '
+                  f'integer day {t_current * 1000:9.1f} ms   x{t_legacy / t_current:.1f}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
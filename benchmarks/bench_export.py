@@ -0,0 +1,71 @@
+"""Streaming export: time-to-first-byte, throughput and peak memory.
+
+Fills a throwaway database with --rows transactions and streams /api/export
+in both formats through the Flask test client, next to the fully
+materialised GET /api/transactions over the same range for reference.
+
+Usage: python benchmarks/bench_export.py [--rows 500000]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_date_column import build_db  # noqa: E402
+
+
+def consume(client, url, track_memory):
+    if track_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    response = client.get(url, buffered=False)
+    first = None
+    size = 0
+    for chunk in response.response:
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(chunk)
+    total = time.perf_counter() - start
+    response.close()
+    peak = None
+    if track_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return first, total, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'budget.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_db(path, args.rows).close()
+            import app as app_module
+        client = app_module.app.test_client()
+        start = (date.today() - timedelta(days=365 * 6)).isoformat()
+        end = (date.today() + timedelta(days=365 * 2)).isoformat()
+
+        print(f'rows={args.rows}')
+        for name, url in (
+            ('export csv', f'/api/export?format=csv&start_date={start}&end_date={end}'),
+            ('export ndjson', f'/api/export?format=ndjson&start_date={start}&end_date={end}'),
+            ('GET /api/transactions', f'/api/transactions?start_date={start}&end_date={end}'),
+        ):
+            first, total, size, _ = consume(client, url, False)
+            _, _, _, peak = consume(client, url, True)
+            print(f'{name:22s} ttfb {first * 1000:8.1f} ms  total {total:6.2f} s  '
+                  f'{args.rows / total:10,.0f} rows/s  {size / 1e6:7.1f} MB  peak mem {peak / 1e6:7.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
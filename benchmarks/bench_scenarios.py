@@ -0,0 +1,150 @@
+"""What-if scenarios: one batched /api/scenarios call vs editing and reverting rules.
+
+Generates a database, then times POST /api/scenarios for a batch of random
+scenarios (rule amount changes, cancellations, added rules, one-offs) over a
+120-month horizon. For comparison it times the old way of answering a single
+"what if" question: PUT the changed rule (which deletes and regenerates its
+future transactions), read the forecast window, then PUT it back.
+
+Before timing, it edits one recurring occurrence and deletes another (both
+edit_type=single). It then checks that the baseline's monthly flows equal the
+unconfirmed transactions /api/transactions returns, for every month inside
+the stored forecast window, and exits 1 if they differ.
+
+Usage: python benchmarks/bench_scenarios.py [--scenarios 50] [--rules 200]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+
+def random_scenarios(rules, count, seed):
+    rng = random.Random(seed)
+    today = date.today()
+    scenarios = []
+    for n in range(count):
+        changes = []
+        for rule in rng.sample(rules, 3):
+            kind = rng.choice(['pct', 'amount', 'cancel'])
+            change = {'recurring_id': rule['id']}
+            if kind == 'pct':
+                change['amount_pct'] = rng.choice([-10, 5, 10])
+            elif kind == 'amount':
+                change['amount'] = round(rule['amount'] * 1.2, 2)
+            else:
+                change['cancel'] = True
+            if rng.random() < 0.5:
+                change['from'] = (today + timedelta(days=rng.randrange(1, 1000))).isoformat()
+            changes.append(change)
+        changes.append({'add': {'amount': -rng.randrange(50, 500), 'frequency': rng.choice(['weekly', 'monthly']),
+                                'start_date': today.isoformat()}})
+        changes.append({'one_off': {'amount': -rng.randrange(500, 5000),
+                                    'date': (today + timedelta(days=rng.randrange(3650))).isoformat()}})
+        scenarios.append({'name': f'scenario {n}', 'changes': changes})
+    return scenarios
+
+
+def check_baseline(client, rule, scenarios, database):
+    """Compare baseline flows with the stored transactions after single edits; returns mismatched months"""
+    today = date.today().isoformat()
+    series = [tx for tx in client.get('/api/transactions').json
+              if tx['recurring_id'] == rule['id'] and tx['date'] >= today and not tx['is_confirmed']]
+    assert client.put(f"/api/transactions/{series[1]['id']}",
+                      json={'amount': series[1]['amount'] * 5, 'edit_type': 'single'}).status_code == 200
+    assert client.delete(f"/api/transactions/{series[2]['id']}").status_code == 200
+
+    conn = database.connect()
+    try:
+        baseline = scenarios.Baseline.load(conn)
+    finally:
+        conn.close()
+    expected = [0.0] * baseline.horizon
+    for tx in client.get('/api/transactions').json:
+        if not tx['is_confirmed']:
+            expected[baseline.month_of(database.to_day(tx['date']))] += tx['amount']
+    # Months that end before any rule's stored rows do
+    stored_through = min(baseline.projected_from.values()) - 1
+    months = [m for m in range(baseline.horizon) if baseline.starts[m + 1] - 1 <= stored_through]
+    mismatched = [(baseline.label(m), round(baseline.flow[m], 2), round(expected[m], 2))
+                  for m in months if abs(baseline.flow[m] - expected[m]) > 0.005]
+    return months, mismatched
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', type=int, default=50)
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--horizon', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='billprepared-scenarios-')
+    try:
+        import database
+        database.DATABASE = os.path.join(workdir, 'budget.db')
+        rules = generator.generate_rules(args.rules, args.years, seed=args.seed)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = generator.generate_database(database.DATABASE, rules, args.years, seed=args.seed)
+            import app as app_module
+            import scenarios
+        client = app_module.app.test_client()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            months, mismatched = check_baseline(client, rules[2], scenarios, database)
+        for label, projected, stored in mismatched:
+            print(f'baseline mismatch in {label}: projected {projected}, stored {stored}')
+        if mismatched:
+            sys.exit(1)
+        print(f'baseline matches stored transactions for {len(months)} months after a single edit and delete')
+        body = {'horizon_months': args.horizon, 'scenarios': random_scenarios(rules, args.scenarios, args.seed)}
+
+        def batch():
+            response = client.post('/api/scenarios', json=body)
+            assert response.status_code == 200, response.status_code
+
+        def edit_and_revert():
+            rule = rules[1]
+            for amount in (round(rule['amount'] * 1.05, 2), rule['amount']):
+                assert client.put(f"/api/recurring/{rule['id']}", json={'amount': amount}).status_code == 200
+                if amount != rule['amount']:
+                    assert client.get('/api/transactions').status_code == 200
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            client.post('/api/scenarios', json=body)  # Warm up
+            t_batch = timed(batch, args.repeat)
+            t_edit = timed(edit_and_revert, args.repeat)
+
+        print(f'{args.rules} rules, {rows} transactions, {args.horizon}-month horizon')
+        print(f'/api/scenarios, {args.scenarios} scenarios  {t_batch * 1000:9.1f} ms  '
+              f'({t_batch / args.scenarios * 1000:.2f} ms per scenario)')
+        print(f'edit rule, read, revert (1 scenario) {t_edit * 1000:9.1f} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Startup cost: versioned migrations vs re-running every schema step.
+
+* init_db on an up-to-date database (one PRAGMA user_version read)
+* the pre-versioning behaviour: every CREATE ... IF NOT EXISTS, column probe
+  and default-setting check on every boot (all migration steps re-run)
+* worker spawn latency: a fresh interpreter importing app, the way each
+  gunicorn worker boots, compared to importing only its third-party deps
+
+Usage: python benchmarks/bench_startup.py [--calls 500] [--spawns 10]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND)
+
+import database  # noqa: E402
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def unversioned_init():
+    conn = database.connect()
+    try:
+        with conn:
+            for migration in database.MIGRATIONS:
+                migration(conn)
+    finally:
+        conn.close()
+
+
+def spawn(code, env, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=BACKEND, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--spawns', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'budget.db')
+        database.DATABASE = path
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            database.init_db()
+            fresh = time.perf_counter() - start
+
+            current = per_call(database.init_db, args.calls)
+            unversioned = per_call(unversioned_init, args.calls)
+
+        env = dict(os.environ, BILLPREPARED_DB=path)
+        deps = spawn('import flask, flask_cors, dateutil.relativedelta', env, args.spawns)
+        worker = spawn('import app', env, args.spawns)
+
+    print(f'init_db on a new database       {fresh * 1000:8.2f} ms')
+    print(f'init_db when already current    {current * 1000:8.3f} ms')
+    print(f'all steps re-run (unversioned)  {unversioned * 1000:8.3f} ms  x{unversioned / current:.1f}')
+    print(f'worker spawn: import deps only  {deps * 1000:8.1f} ms')
+    print(f'worker spawn: import app        {worker * 1000:8.1f} ms  (+{(worker - deps) * 1000:.1f} ms for the app)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Throughput as the number of tenants grows, and cross-tenant isolation.
+
+Every tenant gets a copy of one generated database. Worker threads (each with
+its own test client, like gunicorn gthread workers) issue GET /api/transactions
+for random tenants. Once the tenant count exceeds the per-thread connection
+cache (--max-connections), requests start paying for evictions and reopens.
+
+The isolation check holds a bulk import transaction open on one tenant and
+times small writes on another tenant against writes on the same tenant.
+
+Usage: python benchmarks/bench_tenants.py [--tenants 1,4,16,64] [--threads 8]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run_load(app, tenants, threads, requests_per_thread, seed):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(n):
+        import database
+        rng = random.Random(seed + n)
+        client = app.test_client()
+        local = []
+        for _ in range(requests_per_thread):
+            tenant = rng.choice(tenants)
+            start = time.perf_counter()
+            response = client.get('/api/transactions', headers={'X-Tenant-ID': tenant})
+            local.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.status_code
+        database.close_connections()
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, statistics.median(latencies), _percentile(latencies, 0.95)
+
+
+def isolation(app, bulk_rows):
+    """p95 write latency on the bulk-loaded tenant vs another tenant during a bulk import"""
+    import database
+    body = {'description': 'ISOLATION PROBE', 'amount': -1.0, 'date': date.today().isoformat()}
+    today = database.to_day(date.today())
+    results = {}
+    for label, probe_tenant in (('same tenant', 't0'), ('other tenant', 't1')):
+        started = threading.Event()
+
+        def bulk():
+            conn = database.connect('t0')
+            conn.execute('BEGIN IMMEDIATE')
+            started.set()
+            conn.executemany(
+                'INSERT INTO transactions (description, amount, date, day) VALUES (?, ?, ?, ?)',
+                (('BULK IMPORT', -1.0, date.today().isoformat(), today) for _ in range(bulk_rows))
+            )
+            conn.rollback()
+            conn.close()
+
+        loader = threading.Thread(target=bulk)
+        loader.start()
+        started.wait()
+        client = app.test_client()
+        samples = []
+        while loader.is_alive():
+            start = time.perf_counter()
+            response = client.post('/api/transactions', json=body, headers={'X-Tenant-ID': probe_tenant})
+            samples.append(time.perf_counter() - start)
+            # 500 here means the write gave up waiting for the lock (sqlite3 timeout)
+            assert response.status_code in (201, 500), response.status_code
+        loader.join()
+        results[label] = (len(samples), statistics.median(samples), _percentile(samples, 0.95))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', default='1,4,16,64')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    parser.add_argument('--max-connections', type=int, default=16)
+    parser.add_argument('--bulk-rows', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    counts = [int(n) for n in args.tenants.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='billprepared-tenants-')
+    try:
+        template = os.path.join(workdir, 'template.db')
+        rules = generator.generate_rules(20, 1, seed=args.seed)
+        rows = generator.generate_database(template, rules, 1, seed=args.seed)
+
+        import database
+        database.DATABASE = os.path.join(workdir, 'budget.db')
+        database.TENANT_DIR = os.path.join(workdir, 'tenants')
+        database.MAX_OPEN_CONNECTIONS = args.max_connections
+        os.makedirs(database.TENANT_DIR)
+        for n in range(max(counts + [2])):
+            shutil.copyfile(template, os.path.join(database.TENANT_DIR, f't{n}.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app as app_module
+            # Migrate every shard up front so the load runs only measure requests
+            for n in range(max(counts + [2])):
+                database.init_db(f't{n}')
+        app = app_module.app
+
+        print(f'{rows} transactions per tenant, {args.threads} threads, '
+              f'{args.max_connections} cached connections per thread')
+        for count in counts:
+            tenants = [f't{n}' for n in range(count)]
+            throughput, p50, p95 = run_load(app, tenants, args.threads, args.requests, args.seed)
+            print(f'{count:4d} tenants  {throughput:8.1f} req/s  p50 {p50 * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms')
+
+        print(f'\nwrites during a {args.bulk_rows}-row import on t0')
+        for label, (count, p50, p95) in isolation(app, args.bulk_rows).items():
+            print(f'{label:13s} {count:5d} writes  p50 {p50 * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 0.10] [--metric median_ms]
+
+Exits with status 1 when any scenario in the candidate is slower than the
+baseline by more than the threshold (as a fraction), so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, candidate, metric='median_ms', threshold=0.10):
+    """Return a list of (scenario, before, after, change) and the regressed names"""
+    rows = []
+    regressions = []
+    for name, result in candidate['results'].items():
+        if name not in baseline['results']:
+            rows.append((name, None, result[metric], None))
+            continue
+        before = baseline['results'][name][metric]
+        after = result[metric]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare BillPrepared benchmark runs')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--metric', default='median_ms')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    before, after = dict(baseline['meta'].get('params') or {}), dict(candidate['meta'].get('params') or {})
+    if before.pop('today', None) != after.pop('today', None):
+        print('warning: runs generated data anchored to different days (run.py --today); '
+              'row counts and contents differ', file=sys.stderr)
+    if before != after:
+        print('warning: runs used different generator parameters', file=sys.stderr)
+
+    rows, regressions = compare(baseline, candidate, args.metric, args.threshold)
+    print(f'{"scenario":32s} {"baseline":>12s} {"candidate":>12s} {"change":>8s}')
+    for name, before, after, change in rows:
+        if before is None:
+            print(f'{name:32s} {"-":>12s} {after:12.2f} {"new":>8s}')
+        else:
+            flag = '  REGRESSION' if name in regressions else ''
+            print(f'{name:32s} {before:12.2f} {after:12.2f} {change:+8.1%}{flag}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Deterministic synthetic budget data for benchmarks.
+
+Everything is driven by a seeded random.Random and anchored to `today`, so
+the same seed, sizes and today produce byte-identical databases and
+statements across runs and commits. today defaults to date.today(), so
+without an explicit anchor the data moves (and row counts change) from day
+to day; run.py takes it as --today and records it in its results.
+
+* generate_rules: recurring rules spread over daily/weekly/monthly
+* generate_database: a budget.db with those rules, years of confirmed
+  history, the pending last month and the forecast window, plus one-off
+  spending
+* statement_for_confirm / statement_for_recurring: bank-statement CSVs that
+  match the database with noisy descriptions, amounts and dates
+"""
+import csv
+import io
+import os
+import random
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import database  # noqa: E402
+from database import to_day  # noqa: E402
+
+MERCHANTS = [
+    'NETFLIX', 'SPOTIFY', 'RENT PAYMENT', 'GYM MEMBERSHIP', 'ELECTRICITY CO', 'WATER BILL',
+    'BROADBAND', 'MOBILE PHONE', 'CAR INSURANCE', 'COUNCIL TAX', 'HOME INSURANCE', 'CLOUD STORAGE',
+    'NEWSPAPER', 'PET INSURANCE', 'CHILDCARE', 'LOAN REPAYMENT', 'CHARITY DONATION', 'MUSIC LESSONS',
+]
+ONE_OFF = ['TESCO STORES', 'CORNER CAFE', 'FUEL STATION', 'PHARMACY', 'BOOKSHOP', 'TAKEAWAY', 'HARDWARE']
+
+# (frequency, interval, weight)
+FREQUENCIES = [('monthly', 1, 50), ('monthly', 3, 5), ('weekly', 1, 25), ('weekly', 2, 10), ('daily', 1, 3), ('daily', 7, 7)]
+
+
+def _step(current, frequency, interval):
+    if frequency == 'daily':
+        return current + timedelta(days=interval)
+    if frequency == 'weekly':
+        return current + timedelta(weeks=interval)
+    return current + relativedelta(months=interval)
+
+
+def generate_rules(count, years, seed=0, today=None):
+    """Return a list of recurring rule dicts starting `years` before today"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    weights = [w for _, _, w in FREQUENCIES]
+    rules = []
+    for i in range(count):
+        frequency, interval, _ = rng.choices(FREQUENCIES, weights)[0]
+        if i == 0:
+            frequency, interval = 'monthly', 1
+            description, amount = 'SALARY ACME LTD', 3200.0
+        else:
+            description = f'{MERCHANTS[i % len(MERCHANTS)]} {i // len(MERCHANTS) or ""}'.strip()
+            amount = -round(rng.uniform(3, 80) if frequency == 'daily' else rng.uniform(5, 1500), 2)
+        start = today - timedelta(days=365 * years) + timedelta(days=rng.randrange(28))
+        rules.append({
+            'id': i + 1,
+            'description': description,
+            'amount': amount,
+            'start_date': start,
+            'label': None,
+            'frequency': frequency,
+            'interval': interval,
+        })
+    return rules
+
+
+def occurrences(rule, end):
+    current = rule['start_date']
+    while current <= end:
+        yield current
+        current = _step(current, rule['frequency'], rule['interval'])
+
+
+def generate_database(path, rules, years, forecast_months=12, one_off_per_day=3, seed=0, today=None):
+    """Create a populated budget database at `path`"""
+    rng = random.Random(seed + 1)
+    today = today or date.today()
+    pending_from = today - timedelta(days=30)
+    forecast_end = today + relativedelta(months=forecast_months)
+
+    previous = database.DATABASE
+    database.DATABASE = path
+    try:
+        database.init_db()
+    finally:
+        database.DATABASE = previous
+
+    conn = sqlite3.connect(path)
+    conn.executemany('''
+        INSERT INTO recurring_transactions (id, description, amount, start_date, label, frequency, interval)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(r['id'], r['description'], r['amount'], r['start_date'].isoformat(), r['label'], r['frequency'], r['interval'])
+          for r in rules])
+
+    rows = []
+    for rule in rules:
+        for d in occurrences(rule, forecast_end):
+            confirmed = d < pending_from
+            amount = rule['amount']
+            if confirmed:
+                # History drifts a little from the rule amount
+                amount = round(amount * rng.uniform(0.97, 1.03), 2)
+            rows.append((rule['description'], amount, d.isoformat(), to_day(d), rule['label'], True, rule['id'], confirmed))
+
+    d = today - timedelta(days=365 * years)
+    while d < today:
+        for _ in range(rng.randrange(one_off_per_day * 2 + 1)):
+            rows.append((rng.choice(ONE_OFF), -round(rng.uniform(2, 120), 2), d.isoformat(), to_day(d), None, False, None, d < pending_from))
+        d += timedelta(days=1)
+
+    rows.sort(key=lambda r: r[3])
+    conn.executemany('''
+        INSERT INTO transactions (description, amount, date, day, label, is_recurring, recurring_id, is_confirmed)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('forecast_period', ?)", (str(forecast_months),))
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def noisy_description(description, rng):
+    """Mimic how banks mangle merchant names on statements"""
+    variants = [
+        lambda d: d,
+        lambda d: f'{d} REF{rng.randrange(10**6):06d}',
+        lambda d: f'CARD PAYMENT TO {d}',
+        lambda d: f'{d.title()} {rng.randrange(1000, 9999)}',
+        lambda d: f'{d}*{rng.choice(["LONDON", "ONLINE", "GB", "DD"])}',
+    ]
+    return rng.choice(variants)(description)
+
+
+def _write_csv(rows, date_format):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for d, amount, description in rows:
+        writer.writerow([d.strftime(date_format), f'{amount:.2f}', description])
+    return out.getvalue().encode()
+
+
+def statement_for_confirm(rules, days=30, extra_rows=200, seed=0, today=None, date_format='%d/%m/%Y'):
+    """Statement covering the pending window: noisy copies of rule occurrences plus unmatched spending"""
+    rng = random.Random(seed + 2)
+    today = today or date.today()
+    start = today - timedelta(days=days)
+    rows = []
+    for rule in rules:
+        for d in occurrences(rule, today):
+            if d < start:
+                continue
+            amount = rule['amount'] if rng.random() < 0.6 else round(rule['amount'] * rng.uniform(0.9, 1.1), 2)
+            shift = 0 if rng.random() < 0.7 else rng.randint(-2, 2)
+            rows.append((d + timedelta(days=shift), amount, noisy_description(rule['description'], rng)))
+    for _ in range(extra_rows):
+        d = start + timedelta(days=rng.randrange(days))
+        rows.append((d, -round(rng.uniform(2, 120), 2), noisy_description(rng.choice(ONE_OFF), rng)))
+    rows.sort(key=lambda r: r[0])
+    return _write_csv(rows, date_format)
+
+
+def statement_for_recurring(rules, years, extra_per_day=2, seed=0, today=None, date_format='%d/%m/%Y'):
+    """Multi-year history statement for recurring detection"""
+    rng = random.Random(seed + 3)
+    today = today or date.today()
+    start = today - timedelta(days=365 * years)
+    rows = []
+    for rule in rules:
+        for d in occurrences(rule, today):
+            rows.append((d, rule['amount'], noisy_description(rule['description'], rng)))
+    d = start
+    while d < today:
+        for _ in range(rng.randrange(extra_per_day * 2 + 1)):
+            rows.append((d, -round(rng.uniform(2, 120), 2), noisy_description(rng.choice(ONE_OFF), rng)))
+        d += timedelta(days=1)
+    rows.sort(key=lambda r: r[0])
+    return _write_csv(rows, date_format)
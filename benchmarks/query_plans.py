@@ -0,0 +1,217 @@
+"""Query-plan regression check for every SQL statement the API runs.
+
+Drives every endpoint through the Flask test client against a generated
+database (with part of its history archived, so archive paths run too),
+capturing each statement with instrumentation.capture_statements(). Every
+distinct statement is then run through EXPLAIN QUERY PLAN, and the check
+fails (exit 1) if any plan scans a whole table or sorts in a temp b-tree,
+unless the statement is listed in ALLOWED with a reason. It also fails if
+any request answers other than 2xx, since a rejected call skips the SQL
+it was meant to exercise.
+
+Also lists indexes that no captured plan used, as candidates for removal.
+
+Usage:
+    python benchmarks/query_plans.py [--analyze] [--verbose]
+"""
+import argparse
+import contextlib
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+# Statements allowed to scan or sort: (pattern matched against the
+# whitespace-normalised SQL, reason)
+ALLOWED = [
+    (r"^SELECT seq FROM sqlite_sequence WHERE name = 'change_log'$",
+     'sqlite_sequence has one row per AUTOINCREMENT table and no index'),
+    (r'^DELETE FROM change_log WHERE seq <= \? OR created_at < ',
+     'change log compaction: at most hourly, and it deletes the old rows it scans'),
+    (r'^SELECT key, value FROM settings$', 'reads every setting (a handful of rows)'),
+    (r'^SELECT id, description, amount, start_date, frequency, interval, end_date FROM recurring_transactions$',
+     'scenario baseline needs every recurring rule'),
+    (r'^SELECT \* FROM (recurring_transactions|settings|users|user_settings) WHERE id IN \(',
+     'change feed row fetch: with ANALYZE stats, the planner scans a small table when the id list covers most of it'),
+    (r'^SELECT .* FROM \( SELECT .* FROM transactions WHERE 1=1 UNION ALL SELECT .* FROM transactions_archive WHERE 1=1 ORDER BY day, id \)$',
+     'unfiltered export reads every transaction, in index order'),
+]
+
+_TABLE_SCAN = re.compile(r'^SCAN (\w+)')
+_INDEX_USED = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+def normalise(sql):
+    return ' '.join(sql.split())
+
+
+def exercise(client, rules):
+    """Call every endpoint at least once, covering the main branches"""
+    today = date.today()
+    iso = today.isoformat()
+    calls = []
+
+    def call(method, url, **kwargs):
+        response = getattr(client, method)(url, **kwargs)
+        response.get_data()  # Run streamed bodies (export) to completion
+        calls.append((method.upper(), url, response.status_code))
+        return response
+
+    call('get', '/')
+    call('get', '/api/transactions')
+    call('get', f'/api/transactions?start_date={(today - timedelta(days=900)).isoformat()}&end_date={iso}')
+    call('get', f'/api/transactions?start_date={iso}&end_date={(today + timedelta(days=90)).isoformat()}&confirmed=false&limit=20&offset=5')
+    call('get', '/api/balance')
+    call('put', '/api/balance', json={'balance': 1234.5})
+    call('get', '/api/settings')
+    call('post', '/api/settings', json={'forecast_period': 12, 'recurring_sensitivity': 0.75,
+                                        'custom_auto_confirm_algorithm': {'similarity_threshold': 0.7}})
+    call('post', '/api/settings/recurring_sensitivity/restore')
+    call('get', '/api/user/preferences')
+    call('post', '/api/user/preferences', json={'show_advanced': True})
+
+    tx_id = call('post', '/api/transactions', json={'description': 'PLAN CHECK', 'amount': -5, 'date': iso}).json['id']
+    call('put', f'/api/transactions/{tx_id}', json={'amount': -6})
+    call('put', f'/api/transactions/{tx_id}/confirm')
+    call('delete', f'/api/transactions/{tx_id}')
+
+    recurring_id = call('post', '/api/recurring', json={
+        'description': 'PLAN CHECK RULE', 'amount': -20, 'frequency': 'weekly',
+        'start_date': (today - timedelta(days=60)).isoformat()}).json['id']
+    call('put', f'/api/recurring/{recurring_id}', json={'amount': -25})
+
+    def series():
+        # Future edits regenerate the rest of the series with new ids, so re-read it after each
+        rows = call('get', f'/api/transactions?start_date={(today - timedelta(days=31)).isoformat()}'
+                           f'&end_date={(today + timedelta(days=365)).isoformat()}').json
+        return [tx for tx in rows if tx['recurring_id'] == recurring_id]
+
+    call('put', f"/api/transactions/{series()[-3]['id']}", json={'amount': -30, 'edit_type': 'future'})
+    moved = series()[-2]
+    call('put', f"/api/transactions/{moved['id']}",
+         json={'date': (date.fromisoformat(moved['date']) + timedelta(days=1)).isoformat(), 'edit_type': 'future'})
+    call('delete', f"/api/transactions/{series()[-1]['id']}?delete_type=future")
+    first = series()[0]
+    call('post', '/api/import/confirm_update', json={
+        'transaction_id': first['id'], 'recurring_id': recurring_id, 'new_amount': -27, 'update_future': True})
+    call('delete', f'/api/recurring/{recurring_id}')
+
+    statement = generator.statement_for_confirm(rules, extra_rows=50)
+    call('post', '/api/import/csv/confirm', data={'file': (io.BytesIO(statement), 'statement.csv')})
+    history = generator.statement_for_recurring(rules, 1)
+    call('post', '/api/import/csv/recurring', data={'file': (io.BytesIO(history), 'history.csv')})
+
+    call('get', '/api/changes')
+    call('get', '/api/changes?since=0&limit=100')
+    call('get', '/api/export?format=csv')
+    call('get', f'/api/export?format=ndjson&start_date={(today - timedelta(days=400)).isoformat()}&end_date={iso}&confirmed=true')
+    call('get', f"/api/export?format=csv&recurring_id={rules[1]['id']}")
+    call('post', '/api/scenarios', json={'scenarios': [
+        {'changes': [{'recurring_id': rules[1]['id'], 'amount_pct': 5}]},
+        {'changes': [{'recurring_id': rules[2]['id'], 'cancel': True, 'from': (today + timedelta(days=90)).isoformat()}]},
+    ]})
+    admin = {'Authorization': 'Bearer query-plans'}
+    call('post', '/api/admin/backup', headers=admin)
+    call('get', '/api/admin/backups', headers=admin)
+    call('post', '/api/admin/restore', json={'at': iso}, headers=admin)
+    return calls
+
+
+def check(conn, statements):
+    """Return (findings, used_indexes, checked) for the captured statements"""
+    findings = []
+    used = set()
+    seen = set()
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for sql, params in statements:
+        text = normalise(sql)
+        if text in seen or not re.match(r'^(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', text, re.I):
+            continue
+        seen.add(text)
+        if params is None:  # executemany: plan with NULLs for the parameters
+            params = [None] * sql.count('?')
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        used.update(match.group(1) for detail in plan for match in [_INDEX_USED.search(detail)] if match)
+        problems = [detail for detail in plan
+                    if 'TEMP B-TREE' in detail
+                    or (_TABLE_SCAN.match(detail) and _TABLE_SCAN.match(detail).group(1) in tables)]
+        if not problems:
+            continue
+        reason = next((why for pattern, why in ALLOWED if re.search(pattern, text)), None)
+        findings.append((text, plan, problems, reason))
+    return findings, used, len(seen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=60)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--analyze', action='store_true', help='run ANALYZE on the fixture first')
+    parser.add_argument('--verbose', action='store_true', help='also print allowed scans')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='billprepared-plans-')
+    try:
+        import database
+        database.DATABASE = os.path.join(workdir, 'budget.db')
+        rules = generator.generate_rules(args.rules, args.years, seed=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.generate_database(database.DATABASE, rules, args.years, seed=0)
+            import app as app_module
+            import archive
+            import instrumentation
+            import backup
+        backup.BACKUP_DIR = os.path.join(workdir, 'backups')
+        app_module.ADMIN_TOKEN = 'query-plans'
+        conn = database.connect()
+        archive.archive_transactions(conn, database.to_day(date.today()) - 365)
+        if args.analyze:
+            conn.execute('ANALYZE')
+            conn.commit()
+
+        # Capturing needs instrumented connections
+        instrumentation.configure(enabled=True)
+        database.close_connections()
+        with contextlib.redirect_stdout(io.StringIO()), instrumentation.capture_statements() as statements:
+            calls = exercise(app_module.app.test_client(), rules)
+        instrumentation.configure(enabled=False)
+
+        failed_calls = [call for call in calls if not 200 <= call[2] < 300]
+        findings, used, checked = check(conn, statements)
+        indexes = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name")]
+        conn.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failures = [finding for finding in findings if finding[3] is None]
+    print(f'{len(calls)} requests, {checked} distinct statements checked')
+    for text, plan, problems, reason in findings:
+        if reason is None or args.verbose:
+            print(f"\n{'ALLOWED' if reason else 'FAIL'}: {text}")
+            for detail in plan:
+                print(f'    {detail}')
+            if reason:
+                print(f'    reason: {reason}')
+    unused = [name for name in indexes if name not in used]
+    if unused:
+        print(f"\nindexes no plan used: {', '.join(unused)}")
+    for method, url, status in failed_calls:
+        print(f'request failed: {method} {url} -> {status}')
+
+    if failures or failed_calls:
+        print(f'\n{len(failures)} statement(s) with full scans or temp b-trees')
+        sys.exit(1)
+    print('\nok: no unexpected full scans or temp b-trees')
+
+
+if __name__ == '__main__':
+    main()
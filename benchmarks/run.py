@@ -0,0 +1,249 @@
+"""Timed endpoint scenarios through the Flask test client.
+
+Builds a synthetic database once per run (see generator.py), then times each
+scenario against a fresh copy of it so mutations never leak between
+repetitions. Results are written as JSON; compare two runs with compare.py.
+
+The generated data is anchored to --today (default: the current date), which
+is recorded in the results. The app itself still reads the clock, so windows
+relative to now (the default transaction window, auto-confirm) see the same
+data only when runs are taken on the same day with the same anchor.
+
+Usage:
+    python benchmarks/run.py [--scale small|medium|large] [--repeat 5] [--today 2026-01-01] [--out results.json]
+    python benchmarks/run.py --only get_transactions --only import_csv_confirm
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import generator  # noqa: E402
+
+SCALES = {
+    'small': {'rules': 20, 'years': 1, 'forecast_months': 12, 'statement_extra': 100},
+    'medium': {'rules': 60, 'years': 3, 'forecast_months': 24, 'statement_extra': 300},
+    'large': {'rules': 200, 'years': 5, 'forecast_months': 120, 'statement_extra': 1000},
+}
+
+
+class Fixture:
+    """A generated template database plus matching statements"""
+
+    def __init__(self, workdir, scale, seed, today=None):
+        self.workdir = workdir
+        self.today = today or date.today()
+        self.params = dict(SCALES[scale], seed=seed, today=self.today.isoformat())
+        self.rules = generator.generate_rules(self.params['rules'], self.params['years'], seed=seed, today=self.today)
+        self.template = os.path.join(workdir, 'template.db')
+        self.rows = generator.generate_database(
+            self.template, self.rules, self.params['years'],
+            forecast_months=self.params['forecast_months'], seed=seed, today=self.today
+        )
+        self.confirm_csv = generator.statement_for_confirm(self.rules, extra_rows=self.params['statement_extra'],
+                                                           seed=seed, today=self.today)
+        self.recurring_csv = generator.statement_for_recurring(self.rules, self.params['years'], seed=seed,
+                                                               today=self.today)
+        self.live = os.path.join(workdir, 'budget.db')
+
+    def reset(self):
+        """Point the app at a fresh copy of the template database"""
+        import database
+        # Cached connections still point at the previous copy
+        database.close_connections()
+        # Drop WAL/shm files left by the previous run so they aren't replayed onto the copy
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.live + suffix):
+                os.remove(self.live + suffix)
+        shutil.copyfile(self.template, self.live)
+        database.DATABASE = self.live
+
+
+def _upload(payload, name='statement.csv'):
+    return {'file': (io.BytesIO(payload), name)}
+
+
+def scenario_get_transactions(client, fixture):
+    def run():
+        response = client.get('/api/transactions')
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def scenario_get_transactions_full_window(client, fixture):
+    today = fixture.today
+    url = '/api/transactions?start_date={}&end_date={}'.format(
+        (today - timedelta(days=365 * fixture.params['years'])).isoformat(),
+        (today + timedelta(days=31 * fixture.params['forecast_months'])).isoformat(),
+    )
+
+    def run():
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def scenario_get_transactions_not_modified(client, fixture):
+    etag = client.get('/api/transactions').headers['ETag']
+
+    def run():
+        response = client.get('/api/transactions', headers={'If-None-Match': etag})
+        assert response.status_code == 304, response.status_code
+    return run
+
+
+def scenario_add_recurring_transaction(client, fixture):
+    body = {
+        'description': 'BENCH SUBSCRIPTION',
+        'amount': -12.99,
+        'start_date': (fixture.today - timedelta(days=10)).isoformat(),
+        'frequency': 'weekly',
+    }
+
+    def run():
+        response = client.post('/api/recurring', json=body)
+        assert response.status_code == 201, response.status_code
+    return run
+
+
+def scenario_update_recurring_transaction(client, fixture):
+    # Rule 2 is the first non-salary rule; change its amount and regenerate
+    def run():
+        response = client.put('/api/recurring/2', json={'amount': -99.5})
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def scenario_import_csv_confirm(client, fixture):
+    def run():
+        response = client.post('/api/import/csv/confirm', data=_upload(fixture.confirm_csv))
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def scenario_import_csv_recurring(client, fixture):
+    def run():
+        response = client.post('/api/import/csv/recurring', data=_upload(fixture.recurring_csv))
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+SCENARIOS = {
+    'get_transactions': scenario_get_transactions,
+    'get_transactions_full_window': scenario_get_transactions_full_window,
+    'get_transactions_not_modified': scenario_get_transactions_not_modified,
+    'add_recurring_transaction': scenario_add_recurring_transaction,
+    'update_recurring_transaction': scenario_update_recurring_transaction,
+    'import_csv_confirm': scenario_import_csv_confirm,
+    'import_csv_recurring': scenario_import_csv_recurring,
+}
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': ordered[0] * 1000,
+        'median_ms': statistics.median(ordered) * 1000,
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'max_ms': ordered[-1] * 1000,
+        'stdev_ms': statistics.stdev(ordered) * 1000 if len(ordered) > 1 else 0.0,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenarios(scale='small', repeat=5, seed=0, only=None, quiet=True, instrument=False, today=None):
+    workdir = tempfile.mkdtemp(prefix='billprepared-bench-')
+    sink = io.StringIO() if quiet else sys.stdout
+    try:
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(sink):
+            fixture = Fixture(workdir, scale, seed, today)
+            fixture.reset()
+            import app as app_module
+            import instrumentation
+            instrumentation.configure(enabled=instrument)
+        setup_s = time.perf_counter() - t0
+        client = app_module.app.test_client()
+
+        results = {}
+        for name, factory in SCENARIOS.items():
+            if only and name not in only:
+                continue
+            samples = []
+            for _ in range(repeat):
+                fixture.reset()
+                run = factory(client, fixture)
+                with contextlib.redirect_stdout(sink):
+                    start = time.perf_counter()
+                    run()
+                    samples.append(time.perf_counter() - start)
+                sink.seek(0)
+                sink.truncate()
+            results[name] = _summary(samples)
+            print(f'{name:32s} median {results[name]["median_ms"]:9.2f} ms  min {results[name]["min_ms"]:9.2f} ms',
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': scale,
+            'params': fixture.params,
+            'transaction_rows': fixture.rows,
+            'repeat': repeat,
+            'instrumented': instrument,
+            'setup_s': setup_s,
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run BillPrepared endpoint benchmarks')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--today', type=date.fromisoformat, help='Date the generated data is anchored to (default: now)')
+    parser.add_argument('--only', action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('--instrument', action='store_true',
+                        help='Run with SQL/request instrumentation enabled to measure its overhead')
+    parser.add_argument('--out', help='Write JSON results to this file (default: stdout)')
+    args = parser.parse_args()
+
+    report = run_scenarios(args.scale, args.repeat, args.seed, args.only, instrument=args.instrument, today=args.today)
+    payload = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(payload + '\n')
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react'
+import { useState, useEffect, useRef } from 'react'
 import './App.css'
 import SettingsPage from './components/SettingsPage'
 
@@ -13,6 +13,14 @@ interface Transaction {
   is_confirmed: boolean
 }
 
+interface Change {
+  seq: number
+  table: string
+  op: 'insert' | 'update' | 'delete'
+  id: number
+  row: any | null
+}
+
 interface RecurringCandidate {
   description: string
   amount: number
@@ -37,6 +45,9 @@ interface PotentialUpdate {
   amount_difference?: number
 }
 
+// Fallback when the server has no change stream to spare
+const CHANGES_POLL_INTERVAL_MS = 5000
+
 function App() {
   const [currentPage, setCurrentPage] = useState('dashboard')
   const [balance, setBalance] = useState(0)
@@ -88,9 +99,60 @@ function App() {
   useEffect(() => {
     fetchAppSettings();
   }, []);
+  // Live updates: apply change-feed deltas from the backend instead of
+  // refetching the whole transaction window after every mutation
+  const liveFeed = useRef<EventSource | null>(null)
+  const feedSeq = useRef<number | null>(null)
+
   useEffect(() => {
     fetchBalance()
     fetchTransactions()
+    if (typeof EventSource === 'undefined') return
+    let poll: ReturnType<typeof setInterval> | undefined
+    const pollChanges = async () => {
+      try {
+        const since = feedSeq.current === null ? '' : `?since=${feedSeq.current}`
+        const response = await fetch(`${apiUrl}/api/changes${since}`)
+        if (!response.ok) return
+        const feed = await response.json()
+        if (feed.reset) {
+          fetchBalance()
+          fetchTransactions()
+        } else if (feedSeq.current !== null) {
+          applyChanges(feed.changes)
+        }
+        feedSeq.current = feed.seq
+      } catch (error) {
+        console.error('Error polling changes:', error)
+      }
+    }
+    const source = new EventSource(`${apiUrl}/api/changes/stream`)
+    liveFeed.current = source
+    source.addEventListener('ready', (event) => {
+      feedSeq.current = JSON.parse((event as MessageEvent).data).seq
+    })
+    source.addEventListener('changes', (event) => {
+      const feed = JSON.parse((event as MessageEvent).data)
+      feedSeq.current = feed.seq
+      if (feed.reset) {
+        fetchBalance()
+        fetchTransactions()
+        return
+      }
+      applyChanges(feed.changes)
+    })
+    source.onerror = () => {
+      // The server refuses streams past its limit (503); poll the feed instead
+      if (source.readyState === EventSource.CLOSED && poll === undefined) {
+        pollChanges()
+        poll = setInterval(pollChanges, CHANGES_POLL_INTERVAL_MS)
+      }
+    }
+    return () => {
+      source.close()
+      clearInterval(poll)
+      liveFeed.current = null
+    }
   }, [appSettings]) // Re-fetch when settings change, e.g., forecast_period
 
   useEffect(() => {
@@ -263,6 +325,45 @@ function App() {
     }
   }
 
+  const inTransactionWindow = (date: string) => {
+    const startDate = new Date()
+    startDate.setMonth(startDate.getMonth() - 1)
+    const endDate = new Date()
+    endDate.setMonth(endDate.getMonth() + (appSettings.forecast_period || 12))
+    return date >= startDate.toISOString().split('T')[0] && date <= endDate.toISOString().split('T')[0]
+  }
+
+  const applyChanges = (changes: Change[]) => {
+    const txChanges = changes.filter(change => change.table === 'transactions')
+    if (txChanges.length > 0) {
+      setTransactions(prevTransactions => {
+        const byId = new Map(prevTransactions.map(tx => [tx.id, tx] as [number, Transaction]))
+        for (const change of txChanges) {
+          if (change.op === 'delete' || !change.row || !inTransactionWindow(change.row.date)) {
+            byId.delete(change.id)
+          } else {
+            byId.set(change.id, change.row)
+          }
+        }
+        return Array.from(byId.values()).sort((a, b) => a.date.localeCompare(b.date))
+      })
+    }
+    const balanceChange = changes.find(change => change.table === 'user_settings' && change.row)
+    if (balanceChange) {
+      setBalance(balanceChange.row.current_balance)
+    }
+    if (changes.some(change => change.table === 'settings')) {
+      fetchAppSettings()
+    }
+  }
+
+  // With the live feed connected, mutations arrive as deltas; otherwise refetch
+  const refreshAfterMutation = () => {
+    if (liveFeed.current?.readyState !== EventSource.OPEN) {
+      fetchTransactions()
+    }
+  }
+
   const addTransaction = async () => {
     const amount = parseFloat(newTransaction.amount)
     if (isNaN(amount)) {
@@ -286,7 +387,7 @@ function App() {
       })
       if (response.ok) {
         setNewTransaction({ description: '', amount: '', date: new Date().toISOString().split('T')[0], label: '', isRecurring: false, frequency: 'monthly', interval: 1, endDate: '' })
-        fetchTransactions()
+        refreshAfterMutation()
       } else {
         alert('Failed to add recurring transaction')
       }
@@ -303,7 +404,7 @@ function App() {
       })
       if (response.ok) {
         setNewTransaction({ description: '', amount: '', date: new Date().toISOString().split('T')[0], label: '', isRecurring: false, frequency: 'monthly', interval: 1, endDate: '' })
-        fetchTransactions()
+        refreshAfterMutation()
       } else {
         alert('Failed to add transaction')
       }
@@ -354,8 +455,12 @@ function App() {
   const deleteTransaction = async (id: number, type: 'single' | 'future' = 'single') => {
     const confirmMsg = type === 'single' ? 'this transaction' : 'all future transactions'
     if (window.confirm(`Are you sure you want to delete ${confirmMsg}?`)) {
-      await fetch(`${apiUrl}/api/transactions/${id}?delete_type=${type}`, { method: 'DELETE' })
-      fetchTransactions()
+      const response = await fetch(`${apiUrl}/api/transactions/${id}?delete_type=${type}`, { method: 'DELETE' })
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}))
+        alert(error.error || 'Failed to delete transaction')
+      }
+      refreshAfterMutation()
     }
   }
 
@@ -396,9 +501,10 @@ function App() {
       setTransactions(updatedTransactions)
       setEditingTransaction(null)
       // Fetch to ensure consistency
-      fetchTransactions()
+      refreshAfterMutation()
     } else {
-      alert('Failed to update transaction')
+      const error = await response.json().catch(() => ({}))
+      alert(error.error || 'Failed to update transaction')
     }
   }
 
@@ -452,7 +558,7 @@ function App() {
         setCurrentUpdate(data.potential_updates[0])
         setShowUpdatePrompt(true)
       }
-      fetchTransactions()
+      refreshAfterMutation()
     } else {
       alert('Failed to process CSV')
     }
@@ -482,7 +588,7 @@ function App() {
         setShowUpdatePrompt(false)
         setCurrentUpdate(null)
       }
-      fetchTransactions()
+      refreshAfterMutation()
     } else {
       alert('Failed to update')
     }
@@ -523,7 +629,7 @@ function App() {
     if (response.ok) {
       // Mark as added and refresh transactions
       setAddedCandidates(prev => new Set([...prev, index]))
-      fetchTransactions()
+      refreshAfterMutation()
     } else {
       alert('Failed to add recurring transaction')
     }
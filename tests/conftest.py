@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Point the default tenant at a database file of its own for one test"""
+    path = str(tmp_path / 'budget.db')
+    monkeypatch.setattr(database, 'DATABASE', path)
+    monkeypatch.setattr(database, 'TENANT_DIR', str(tmp_path / 'tenants'))
+    database.close_connections()
+    database._migrated.clear()
+    yield path
+    database.close_connections()
+    database._migrated.clear()
+
+
+@pytest.fixture
+def client(db_path):
+    """Flask test client over a freshly migrated database"""
+    import app as app_module
+    database.init_db()
+    return app_module.app.test_client()
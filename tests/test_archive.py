@@ -0,0 +1,38 @@
+import pytest
+
+import archive
+import database
+
+
+@pytest.fixture
+def archived_id(client):
+    response = client.post('/api/transactions', json={
+        'description': 'OLD RENT', 'amount': -900, 'date': '2020-01-01', 'is_confirmed': True})
+    tx_id = response.json['id']
+    conn = database.connect()
+    try:
+        assert archive.archive_transactions(conn, database.to_day('2021-01-01')) == 1
+    finally:
+        conn.close()
+    return tx_id
+
+
+@pytest.mark.parametrize('method, url, body', [
+    ('put', '/api/transactions/{id}', {'amount': -950}),
+    ('delete', '/api/transactions/{id}', None),
+    ('put', '/api/transactions/{id}/confirm', None),
+    ('post', '/api/import/confirm_update', {'transaction_id': '{id}', 'recurring_id': None, 'new_amount': -950}),
+])
+def test_edits_to_archived_transactions_conflict(client, archived_id, method, url, body):
+    if body and body.get('transaction_id') == '{id}':
+        body = dict(body, transaction_id=archived_id)
+    response = getattr(client, method)(url.format(id=archived_id), json=body)
+    assert response.status_code == 409
+    row = database.get_db().execute('SELECT amount FROM transactions_archive WHERE id = ?', (archived_id,)).fetchone()
+    assert row['amount'] == -900
+
+
+def test_confirm_update_of_a_missing_transaction_is_not_found(client):
+    response = client.post('/api/import/confirm_update', json={
+        'transaction_id': 12345, 'recurring_id': None, 'new_amount': -1})
+    assert response.status_code == 404
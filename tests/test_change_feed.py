@@ -0,0 +1,13 @@
+import change_feed
+import database
+
+
+def test_writes_without_readers_keep_the_change_log_bounded(client, monkeypatch):
+    monkeypatch.setattr(change_feed, 'COMPACT_INTERVAL_SECONDS', 0)
+    monkeypatch.setattr(change_feed, 'CHANGE_LOG_MAX_ROWS', 5)
+    for i in range(30):
+        response = client.post('/api/transactions', json={'description': f'TX {i}', 'amount': -1, 'date': '2026-10-05'})
+        assert response.status_code == 201
+    conn = database.get_db()
+    assert conn.execute('SELECT COUNT(*) FROM change_log').fetchone()[0] <= 5
+    assert change_feed.latest_seq(conn) >= 30
@@ -0,0 +1,25 @@
+from csv_import import parse_csv
+
+
+def test_description_header_beats_reference_column():
+    text = ('Date,Reference,Description,Amount\n'
+            '2026-10-05,REF001,TESCO STORES,-12.50\n'
+            '2026-10-06,REF002,NETFLIX,-9.99\n')
+    rows = parse_csv(text)
+    assert [row['description'] for row in rows] == ['TESCO STORES', 'NETFLIX']
+    assert [row['amount'] for row in rows] == [-12.5, -9.99]
+
+
+def test_reference_column_used_without_a_better_header():
+    text = ('Date,Reference,Amount\n'
+            '2026-10-05,TESCO STORES,-12.50\n')
+    assert parse_csv(text)[0]['description'] == 'TESCO STORES'
+
+
+def test_header_only_file_has_no_rows():
+    assert parse_csv('Date,Description,Amount\n') == []
+
+
+def test_unparseable_amount_row_is_skipped():
+    rows = parse_csv('2026-10-05,TESCO,-1.50\n2026-10-06,ALDI,oops\n')
+    assert [row['description'] for row in rows] == ['TESCO']
@@ -0,0 +1,31 @@
+import sqlite3
+
+import pytest
+
+import database
+
+
+def legacy_database(path, dates):
+    """A database as created before the day column, holding one transaction per date"""
+    conn = sqlite3.connect(path)
+    database._migration_initial_schema(conn)
+    conn.executemany("INSERT INTO transactions (description, amount, date) VALUES ('LEGACY', -1, ?)",
+                     [(value,) for value in dates])
+    conn.commit()
+    return conn
+
+
+def test_migration_normalises_non_iso_dates(db_path):
+    conn = legacy_database(db_path, ['2026-10-05', '06/10/2026', '2026-10-07 09:30:00', 'Oct 08, 2026'])
+    database.migrate(conn)
+    rows = conn.execute('SELECT date, day FROM transactions ORDER BY id').fetchall()
+    assert rows == [(value, database.to_day(value))
+                    for value in ('2026-10-05', '2026-10-06', '2026-10-07', '2026-10-08')]
+
+
+def test_migration_stops_on_an_unreadable_date(db_path):
+    conn = legacy_database(db_path, ['2026-10-05', 'next tuesday'])
+    with pytest.raises(ValueError, match='ids 2'):
+        database.migrate(conn)
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == 0
+    assert 'day' not in database._columns(conn, 'transactions')
@@ -0,0 +1,45 @@
+from datetime import date, timedelta
+
+import database
+
+
+def add_rule(client, **fields):
+    rule = dict({'description': 'RENT', 'amount': -1000, 'frequency': 'monthly',
+                 'start_date': (date.today() - timedelta(days=10)).isoformat()}, **fields)
+    response = client.post('/api/recurring', json=rule)
+    assert response.status_code == 201
+    return response.json['id']
+
+
+def test_stored_rule_with_unparseable_start_date_is_skipped(client):
+    rule_id = add_rule(client)
+    with database.get_db() as conn:
+        conn.execute('''
+            INSERT INTO recurring_transactions (description, amount, start_date, frequency)
+            VALUES ('GYM', -30, '01/09/2026', 'monthly')
+        ''')
+        bad_id = conn.execute("SELECT id FROM recurring_transactions WHERE description = 'GYM'").fetchone()[0]
+
+    response = client.post('/api/scenarios', json={'scenarios': [
+        {'changes': [{'recurring_id': rule_id, 'amount_pct': 10}]}]})
+    assert response.status_code == 200
+    assert response.json['skipped_rules'] == [{'id': bad_id, 'description': 'GYM'}]
+    assert response.json['scenarios'][0]['difference'] < 0
+
+
+def test_add_rejects_a_non_iso_start_date(client):
+    response = client.post('/api/scenarios', json={'scenarios': [{'changes': [
+        {'add': {'amount': -50, 'frequency': 'monthly', 'start_date': '01/09/2026'}}]}]})
+    assert response.status_code == 400
+
+
+def test_added_rule_ignores_a_supplied_id(client):
+    rule_id = add_rule(client)
+    added = {'amount': -50, 'frequency': 'monthly', 'start_date': date.today().isoformat()}
+    response = client.post('/api/scenarios', json={'horizon_months': 24, 'scenarios': [
+        {'changes': [{'add': added}]},
+        {'changes': [{'add': dict(added, id=rule_id)}]},
+    ]})
+    assert response.status_code == 200
+    plain, with_id = response.json['scenarios']
+    assert with_id['balances'] == plain['balances']